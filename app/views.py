@@ -2,7 +2,8 @@ import json
 import sys
 import os.path as path
 
-from flask import render_template, jsonify, request
+from flask import (render_template, jsonify, request, Response,
+                   stream_with_context)
 from app import app
 
 base_directory = path.dirname(path.dirname(path.abspath(__file__)))
@@ -45,8 +46,10 @@ def format_transcriptions(transcriptions):
                 for pair in clean_transcriptions.split('\n')]
 
 
-@app.route('/evolve')
-def evolve():
+def evolve_arguments():
+    '''Read the arguments of an evolution from the request, returning a
+    dictionary of the arguments to run_engine, or a response with an error
+    message.'''
     words = [sanitise(word) for word in request.args['words'].split()]
 
     try:
@@ -67,15 +70,93 @@ def evolve():
     optimisation_function = optimisation_functions[request.args['optimisationFunction']]
     metric = metric_functions[request.args['metric']]
 
+    return {'words': words, 'generations': generations,
+            'rewrite_rules': transcriptions, 'reverse': reverse,
+            'metric': metric, 'optimisation_function': optimisation_function}
+
+
+@app.route('/evolve')
+def evolve():
+    arguments = evolve_arguments()
+
+    if isinstance(arguments, Response):
+        return arguments
+
     try:
-        words, rules = engine.run_engine(words, generations, transcriptions,
-                                         reverse, metric, optimisation_function)
+        words, rules = engine.run_engine(**arguments)
     except Exception as e:
         return jsonify({'error': str(e)})
 
     return jsonify({'rules': rules, 'words': words, 'error': 0})
 
 
+@app.route('/evolve/stream')
+def evolve_stream():
+    '''Evolves the language in the same way as /evolve, streaming the result
+    of each generation as it is found. Each message is a JSON object:
+
+        generation: the number of the generation, counting from 1.
+        rule: the rule applied in the generation.
+        indices: the indices of the words changed by the rule.
+        words: the new strings of the changed words.
+
+    The last message holds the list of applied rules in the same order as
+    /evolve, or an error. Messages are sent as newline delimited JSON, or as
+    server-sent events if the client accepts text/event-stream. If the client
+    disconnects, the remaining generations aren't computed.
+    '''
+    arguments = evolve_arguments()
+
+    if isinstance(arguments, Response):
+        return arguments
+
+    server_sent_events = (request.accept_mimetypes.best ==
+                          'text/event-stream')
+
+    def message(contents):
+        contents = json.dumps(contents, ensure_ascii=False)
+
+        if server_sent_events:
+            return 'data: {0}\n\n'.format(contents)
+
+        return contents + '\n'
+
+    def generate():
+        steps = engine.iter_engine(**arguments)
+        rules = []
+
+        # When the client disconnects, the server closes this generator at
+        # the yield it is paused at, which closes the evolution.
+        try:
+            for generation, rule, indices, words in steps:
+                rules.append(rule)
+
+                yield message({'generation': generation, 'rule': rule,
+                               'indices': indices, 'words': words})
+
+        except Exception as e:
+            yield message({'error': str(e)})
+            return
+
+        finally:
+            steps.close()
+
+        if arguments['reverse']:
+            rules.reverse()
+
+        yield message({'rules': rules, 'error': 0})
+
+    if server_sent_events:
+        mimetype = 'text/event-stream'
+    else:
+        mimetype = 'application/x-ndjson'
+
+    # Buffering by a proxy such as nginx would hold back the messages
+    return Response(stream_with_context(generate()), mimetype=mimetype,
+                    headers={'Cache-Control': 'no-cache',
+                             'X-Accel-Buffering': 'no'})
+
+
 @app.route('/apply')
 def apply():
     '''Evolves the language according to the given rules, specified by:
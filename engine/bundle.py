@@ -0,0 +1,191 @@
+import os
+import csv
+import yaml
+import pickle
+import hashlib
+import os.path as path
+
+import parse
+import deparse
+import segment
+from rule import compile_rules
+from cache import atomic_write
+
+base_directory = path.dirname(path.dirname(path.abspath(__file__)))
+data_directory = path.join(base_directory, 'engine', 'data')
+
+# The source files the bundle is compiled from, by name.
+sources = {'segments': path.join(data_directory, 'features.csv'),
+           'diacritics': path.join(data_directory, 'diacritics.yaml'),
+           'rules': path.join(data_directory, 'rules.yaml'),
+           'feature_strings': path.join(data_directory,
+                                        'feature-strings.csv')}
+
+bundle_path = path.join(data_directory, 'bundle.pickle')
+
+# Increased whenever the contents of the bundle change, so bundles written by
+# older versions of the engine are rebuilt.
+bundle_version = 2
+
+
+class Bundle:
+    '''The data used by the engine: the segment, diacritic, rule and feature
+    string lists loaded from the source files, and the objects compiled from
+    them, which are the parse context, the compiled rules and the deparse
+    indexes.'''
+
+    __slots__ = ['segments', 'diacritics', 'rules', 'feature_strings',
+                 'parse_context', 'compiled_rules', 'feature_index',
+                 'decomposition_index']
+
+    def __init__(self, segments, diacritics, rules, feature_strings):
+        self.segments = segments
+        self.diacritics = diacritics
+        self.rules = rules
+        self.feature_strings = feature_strings
+
+        self.parse_context = parse.ParseContext(segments, diacritics)
+        self.compiled_rules = compile_rules(rules)
+        self.feature_index = deparse.FeatureIndex(feature_strings)
+        self.decomposition_index = deparse.DecompositionIndex(segments,
+                                                              diacritics)
+
+    def __getstate__(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    def __setstate__(self, state):
+        for name, value in state.items():
+            setattr(self, name, value)
+
+
+def read_sources(sources=sources):
+    '''Load the segment, diacritic, rule and feature string lists from the
+    source files, and build a Bundle from them.'''
+    with open(sources['segments'], 'r', encoding='utf-8') as f:
+        segments = [segment for segment in csv.DictReader(f)]
+
+    with open(sources['diacritics'], 'r', encoding='utf-8') as f:
+        diacritics = yaml.load(f)
+
+    with open(sources['rules'], 'r', encoding='utf-8') as f:
+        rules = yaml.load(f)
+
+    with open(sources['feature_strings'], 'r', encoding='utf-8') as f:
+        feature_strings = [line for line in csv.reader(f)]
+
+    return Bundle(segments, diacritics, rules, feature_strings)
+
+
+def file_hash(filename):
+    '''Return the SHA-1 hash of the contents of a file.'''
+    with open(filename, 'rb') as f:
+        return hashlib.sha1(f.read()).hexdigest()
+
+
+def source_stamps(sources=sources):
+    '''Return a dictionary mapping the name of each source file onto a tuple of
+    its (modification time, size, hash).'''
+    return {name: (os.stat(filename).st_mtime_ns,
+                   os.stat(filename).st_size,
+                   file_hash(filename))
+            for name, filename in sources.items()}
+
+
+def is_current(stamps, sources=sources):
+    '''Returns True if the stamps of a bundle match the source files. Files
+    with the same modification time and size aren't read; other files are
+    compared by hash, so a bundle survives its sources being touched or
+    copied.'''
+    if set(stamps) != set(sources):
+        return False
+
+    for name, filename in sources.items():
+        mtime, size, digest = stamps[name]
+
+        try:
+            status = os.stat(filename)
+        except OSError:
+            return False
+
+        if (status.st_mtime_ns, status.st_size) == (mtime, size):
+            continue
+
+        if status.st_size != size or file_hash(filename) != digest:
+            return False
+
+    return True
+
+
+def compile_bundle(filename=bundle_path, sources=sources):
+    '''Build a Bundle from the source files and write it to a file, returning
+    it. The file is written with cache.atomic_write.'''
+    stamps = source_stamps(sources)
+    bundle = read_sources(sources)
+
+    # Features outside feature_order are given bits in the order they're
+    # first seen, so the order is stored to give them the same bits when the
+    # bundle is loaded.
+    contents = {'version': bundle_version,
+                'stamps': stamps,
+                'feature_names': list(segment.feature_names),
+                'bundle': bundle}
+
+    with atomic_write(filename, 'wb') as f:
+        pickle.dump(contents, f, pickle.HIGHEST_PROTOCOL)
+
+    return bundle
+
+
+def restore_feature_names(feature_names):
+    '''Assign the bits of the features in the bundle in the same order as
+    when it was compiled. Returns False if a feature already has a different
+    bit in this process.'''
+    for index, feature in enumerate(feature_names):
+        if feature in segment.feature_bits:
+            if segment.feature_bits[feature] != 1 << index:
+                return False
+
+        elif index == len(segment.feature_names):
+            segment.feature_mask([feature])
+
+        else:
+            return False
+
+    return True
+
+
+def load(filename=bundle_path, sources=sources):
+    '''Return the Bundle stored in the file if it is up to date with the
+    source files. Otherwise, it is compiled again from the sources, and
+    written back to the file if possible.'''
+    try:
+        with open(filename, 'rb') as f:
+            contents = pickle.load(f)
+
+        if (contents['version'] == bundle_version and
+                is_current(contents['stamps'], sources) and
+                restore_feature_names(contents['feature_names'])):
+            return contents['bundle']
+
+    except (OSError, EOFError, pickle.UnpicklingError, AttributeError,
+            KeyError, TypeError, ValueError):
+        pass
+
+    try:
+        return compile_bundle(filename, sources)
+    except OSError:
+        # The data directory may be read only, in which case the bundle is
+        # built in memory each time.
+        return read_sources(sources)
+
+
+if __name__ == '__main__':
+    import sys
+
+    # Run as a script, this module is __main__, so the bundle is compiled
+    # through the imported module for Bundle to be pickled as bundle.Bundle.
+    import bundle
+
+    filename = sys.argv[1] if len(sys.argv) > 1 else bundle_path
+    bundle.compile_bundle(filename)
+    print('Compiled {0}'.format(filename))
@@ -0,0 +1,107 @@
+import os
+import json
+import tempfile
+from threading import Lock
+from contextlib import contextmanager
+from collections import OrderedDict
+
+
+@contextmanager
+def atomic_write(filename, mode='w', encoding=None):
+    '''Open a temporary file in the directory of filename for writing, which
+    is moved into place when the block exits, so that other processes never
+    read a partial file. If the block raises, the temporary file is removed
+    and filename is left unchanged.'''
+    directory = os.path.dirname(os.path.abspath(filename))
+    descriptor, temporary = tempfile.mkstemp(dir=directory, suffix='.tmp')
+
+    try:
+        with os.fdopen(descriptor, mode, encoding=encoding) as f:
+            yield f
+
+        os.replace(temporary, filename)
+    except BaseException:
+        os.remove(temporary)
+        raise
+
+
+class LRUCache:
+    '''A dictionary-like cache holding at most maxsize items. When it is full,
+    the least recently used item is evicted. The number of hits and misses of
+    get are counted, and the cache can be saved to and loaded from a JSON
+    file. It can be shared between threads.'''
+
+    def __init__(self, maxsize=4096):
+        self.maxsize = maxsize
+        self.items = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.lock = Lock()
+
+    def get(self, key, default=None):
+        '''Return the value for key, marking it as recently used, or default
+        if it isn't cached.'''
+        with self.lock:
+            try:
+                value = self.items[key]
+            except KeyError:
+                self.misses += 1
+                return default
+
+            self.hits += 1
+            self.items.move_to_end(key)
+
+        return value
+
+    def __setitem__(self, key, value):
+        with self.lock:
+            self.items[key] = value
+            self.items.move_to_end(key)
+
+            if len(self.items) > self.maxsize:
+                self.items.popitem(last=False)
+
+    def __contains__(self, key):
+        return key in self.items
+
+    def __len__(self):
+        return len(self.items)
+
+    def clear(self):
+        with self.lock:
+            self.items.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def save(self, filename):
+        '''Write the cached items to a JSON file, from least to most recently
+        used. The file is written with atomic_write.'''
+        with self.lock:
+            items = [[key, value] for key, value in self.items.items()]
+
+        with atomic_write(filename, 'w', encoding='utf-8') as f:
+            json.dump(items, f, ensure_ascii=False)
+
+    def load(self, filename):
+        '''Add the items from a JSON file written by save. Keys stored as
+        lists are converted back into tuples. Returns False if the file
+        doesn't exist or can't be read.'''
+        try:
+            with open(filename, 'r', encoding='utf-8') as f:
+                items = json.load(f)
+        except (OSError, ValueError):
+            return False
+
+        for key, value in items:
+            self[tuple(key) if isinstance(key, list) else key] = value
+
+        return True
+
+    def __getstate__(self):
+        with self.lock:
+            return {'maxsize': self.maxsize, 'items': self.items.copy(),
+                    'hits': self.hits, 'misses': self.misses}
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.lock = Lock()
@@ -1,6 +1,9 @@
+import hashlib
 from functools import partial, lru_cache
 from Levenshtein import hamming
 
+from cache import LRUCache
+
 feature_order = ['syllabic',
                  'stress',
                  'long',
@@ -30,15 +33,31 @@ feature_order = ['syllabic',
                  'back',
                  'tense']
 
-@lru_cache(maxsize=None)
+# The maximum number of distinct feature bundles whose feature strings are
+# cached.
+feature_string_cache_size = 4096
+
+# The maximum number of segment matches kept by a deparse cache.
+deparse_cache_size = 65536
+
+
 def feature_string(segment):
     '''Convert a Segment object into a feature string.'''
+    return segment.feature_string
+
+
+@lru_cache(maxsize=feature_string_cache_size)
+def mask_feature_string(positive_mask, negative_mask):
+    '''Convert a pair of feature masks, as stored by a Segment, into a feature
+    string.'''
     feature_string = ''
 
-    for feature in feature_order:
-        if feature in segment.positive:
+    # Features are indexed by bit in the same order as feature_order, so the
+    # masks can be walked directly instead of searching the feature lists.
+    for index in range(len(feature_order)):
+        if positive_mask >> index & 1:
             feature_string += '+'
-        elif feature in segment.negative:
+        elif negative_mask >> index & 1:
             feature_string += '-'
         else:
             feature_string += '0'
@@ -46,17 +65,449 @@ def feature_string(segment):
     return feature_string
 
 
-def segment_match(feature_strings, target_segment):
+class FeatureIndex:
+    '''An index of a feature string table, for finding the best match for a
+    feature string without computing its distance to every row.
+
+    Identical feature strings are looked up in a dictionary. Otherwise, the
+    distinct feature strings of the table are searched with a BK-tree, a tree
+    in which the children of each node are keyed by their Hamming distance to
+    it, so that the triangle inequality can be used to skip whole subtrees.
+    Ties are broken in the same way as the linear search in segment_match: the
+    shortest IPA string wins, and the first in table order among those.
+
+    '''
+
+    def __init__(self, feature_strings):
+        self.feature_strings = feature_strings
+        self.version = table_version(feature_strings)
+        self.alphabet = {}
+
+        # The best IPA string for each distinct feature string, as a tuple of
+        # (length, table position, IPA string) so that the minimum is the one
+        # segment_match would choose.
+        self.exact = {}
+
+        for position, (IPA, string) in enumerate(feature_strings):
+            entry = (len(IPA), position, IPA)
+
+            if string not in self.exact or entry < self.exact[string]:
+                self.exact[string] = entry
+
+        self.width = max((len(string) for string in self.exact), default=0)
+
+        for string in self.exact:
+            for character in string:
+                self.alphabet.setdefault(character, len(self.alphabet))
+
+        # Each node is a list of [encoded string, entry, children]
+        self.root = None
+
+        for string, entry in self.exact.items():
+            self.insert(self.encode(string), entry)
+
+    def encode(self, string):
+        '''Encode a feature string as an integer with one bit set for each
+        position, in the block of bits belonging to the character at that
+        position. Two strings differ at a position if and only if both of
+        their bits for it differ, so the Hamming distance is half the number
+        of bits set in their exclusive or.'''
+        if len(string) != self.width:
+            raise ValueError('Feature string {0} has the wrong length'.format(
+                string))
+
+        encoded = 0
+        unknown = len(self.alphabet)
+
+        for position, character in enumerate(string):
+            # Characters not in the table are given their own block, which
+            # never matches any row.
+            block = self.alphabet.get(character, unknown)
+            encoded |= 1 << (block * self.width + position)
+
+        return encoded
+
+    def insert(self, encoded, entry):
+        '''Add an encoded feature string to the BK-tree.'''
+        node = [encoded, entry, {}]
+
+        if self.root is None:
+            self.root = node
+            return
+
+        parent = self.root
+
+        while True:
+            distance = (parent[0] ^ encoded).bit_count() >> 1
+            child = parent[2].get(distance)
+
+            if child is None:
+                parent[2][distance] = node
+                return
+
+            parent = child
+
+    def nearest(self, target_feature_string):
+        '''Return the IPA string which best matches the given feature string,
+        by Hamming distance.'''
+        entry = self.exact.get(target_feature_string)
+
+        if entry is not None:
+            return entry[2]
+
+        target = self.encode(target_feature_string)
+
+        # Most unmatched segments are a single feature away from a row, and
+        # all of those rows can be found by changing one position at a time.
+        neighbours = [self.exact.get(target_feature_string[:position] +
+                                     character +
+                                     target_feature_string[position + 1:])
+                      for position in range(self.width)
+                      for character in self.alphabet
+                      if character != target_feature_string[position]]
+        neighbours = [entry for entry in neighbours if entry is not None]
+
+        if neighbours:
+            return min(neighbours)[2]
+
+        best_distance = float('inf')
+        best_entry = None
+
+        # Each item on the stack holds a lower bound on the distance from the
+        # target to anything in the subtree, so that subtrees queued before a
+        # closer match was found can still be skipped.
+        stack = [(0, self.root)]
+
+        while stack:
+            bound, node = stack.pop()
+
+            if bound > best_distance:
+                continue
+
+            distance = (node[0] ^ target).bit_count() >> 1
+
+            if distance < best_distance:
+                best_distance = distance
+                best_entry = node[1]
+
+            elif distance == best_distance and node[1] < best_entry:
+                best_entry = node[1]
+
+            # Anything in the child keyed by k is k away from this node, so it
+            # is at least |distance - k| away from the target.
+            for key, child in node[2].items():
+                bound = abs(distance - key)
+
+                if bound <= best_distance:
+                    stack.append((bound, child))
+
+        return best_entry[2]
+
+
+class DecompositionIndex:
+    '''An index which deparses a feature string by decomposing it into a base
+    segment and diacritics, rather than by matching it against an enumerated
+    table of combinations.
+
+    Each base segment is tried, closest first, and diacritics are added to it
+    greedily while they reduce the distance to the target. A diacritic can
+    only be added to a segment which meets its conditions. The best
+    decomposition is the one with the smallest distance, and among ties, the
+    shortest IPA string, and the first base segment in the list. Diacritics
+    are written in the order of the diacritic list, which is the order the
+    parser adds them in, so every result parses back to the segment that was
+    scored.
+
+    Segments are compared as pairs of (positive mask, negative mask), with a
+    bit for each feature in feature_order, and each diacritic is stored as
+    the masks of its conditions and of the features it sets.
+
+    '''
+
+    def __init__(self, segments, diacritics):
+        self.width = len(feature_order)
+
+        self.bases = [(segment['IPA'],) +
+                      string_masks(''.join(segment[feature]
+                                           for feature in feature_order))
+                      for segment in segments]
+
+        self.diacritics = [
+            (diacritic['IPA'],
+             order_mask(diacritic['conditions'].get('positive', [])),
+             order_mask(diacritic['conditions'].get('negative', [])),
+             order_mask(diacritic['applies'].get('positive', [])),
+             order_mask(diacritic['applies'].get('negative', [])))
+            for diacritic in diacritics]
+
+        # The bases grouped by the diacritics which can be added to them,
+        # alone or after others, as a list of tuples of (positions of the
+        # diacritics, positions of the bases). Only these diacritics can bring
+        # a base closer to the target.
+        groups = {}
+
+        for index, (IPA, positive, negative) in enumerate(self.bases):
+            groups.setdefault(self.reachable(positive, negative),
+                              []).append(index)
+
+        self.groups = [([diacritic for diacritic in range(len(diacritics))
+                         if reachable & 1 << diacritic], indices)
+                       for reachable, indices in groups.items()]
+
+        # Base segments which match exactly, keeping the first of the
+        # shortest.
+        self.exact = {}
+
+        for IPA, positive, negative in self.bases:
+            string = mask_feature_string(positive, negative)
+
+            if (string not in self.exact or
+                    len(IPA) < len(self.exact[string])):
+                self.exact[string] = IPA
+
+        self.version = table_version(
+            [[IPA, mask_feature_string(positive, negative)]
+             for IPA, positive, negative in self.bases] +
+            [[IPA] + [mask_feature_string(mask, 0) for mask in masks]
+             for IPA, *masks in self.diacritics])
+
+    def reachable(self, positive, negative):
+        '''Return a mask of the diacritics which can be added to a segment,
+        alone or after other diacritics. This may include diacritics which
+        can't be added together, but never leaves out one which can.'''
+        reachable = 0
+        changed = True
+
+        # The masks grow into the features which may be positive or negative
+        # once the reachable diacritics are added, in any order
+        while changed:
+            changed = False
+
+            for index, (IPA, condition_positive, condition_negative,
+                        applies_positive, applies_negative) in enumerate(
+                            self.diacritics):
+                if (not reachable & 1 << index and
+                        positive & condition_positive == condition_positive
+                        and
+                        negative & condition_negative == condition_negative):
+                    reachable |= 1 << index
+                    positive |= applies_positive
+                    negative |= applies_negative
+                    changed = True
+
+        return reachable
+
+    def compose(self, positive, negative, chosen):
+        '''Add the diacritics at the given positions in the diacritic list to
+        the segment masks, in order. Returns None if the segment doesn't meet
+        the conditions of one of them.'''
+        for index in chosen:
+            (IPA, condition_positive, condition_negative,
+             applies_positive, applies_negative) = self.diacritics[index]
+
+            if (positive & condition_positive != condition_positive or
+                    negative & condition_negative != condition_negative):
+                return None
+
+            positive = (positive | applies_positive) & ~applies_negative
+            negative = (negative & ~applies_positive) | applies_negative
+
+        return positive, negative
+
+    def nearest(self, target_feature_string):
+        '''Return the IPA string of the base segment and diacritics which best
+        match the given feature string.'''
+        IPA = self.exact.get(target_feature_string)
+
+        if IPA is not None:
+            return IPA
+
+        if len(target_feature_string) != self.width:
+            raise ValueError('Feature string {0} has the wrong length'.format(
+                target_feature_string))
+
+        target_positive, target_negative = string_masks(target_feature_string)
+
+        # The features each diacritic sets to the target value, and to another
+        # value, are the same whatever it's added to, so they are computed
+        # once. Adding a diacritic then reduces the distance by the
+        # mismatches of the segment in the first, less its matches in the
+        # second.
+        deltas = []
+
+        for diacritic, (IPA, condition_positive, condition_negative,
+                        applies_positive, applies_negative) in enumerate(
+                            self.diacritics):
+            wrong = (((applies_positive ^ target_positive) |
+                      (applies_negative ^ target_negative)) &
+                     (applies_positive | applies_negative))
+            deltas.append((diacritic, condition_positive, condition_negative,
+                           applies_positive, applies_negative,
+                           (applies_positive | applies_negative) & ~wrong,
+                           wrong))
+
+        # A feature of a base can only be brought to the target value by a
+        # reachable diacritic which sets it to that value, so the mismatches
+        # in the other features are a lower bound on the distance reachable
+        # from the base. Diacritics which set no feature to the target value
+        # never reduce the distance, so they are left out.
+        candidates = []
+
+        for diacritics, indices in self.groups:
+            group = [deltas[diacritic] for diacritic in diacritics
+                     if deltas[diacritic][5]]
+            fixable = 0
+
+            for delta in group:
+                fixable |= delta[5]
+
+            for index in indices:
+                IPA, positive, negative = self.bases[index]
+                mismatch = ((positive ^ target_positive) |
+                            (negative ^ target_negative))
+                candidates.append(((mismatch & ~fixable).bit_count(),
+                                   len(IPA), index, mismatch, group,
+                                   fixable))
+
+        # No decomposition of a base has a smaller key than its bound, the
+        # length of its IPA and its position, so the bases are searched in
+        # that order, and the search stops at the first base whose key can't
+        # beat the best.
+        candidates.sort()
+        best = None
+
+        for bound, length, index, mismatch, group, fixable in candidates:
+            if best is not None and (bound, length, index) > best[:3]:
+                break
+
+            IPA, positive, negative = self.bases[index]
+            distance = mismatch.bit_count()
+            group = list(group)
+            chosen = []
+
+            # Add the diacritic which reduces the distance the most, until
+            # none of them do. Only a diacritic which sets a mismatched
+            # feature to the target value can reduce it. The search of the
+            # base stops once a diacritic breaks features which can't be
+            # fixed, so that it can't beat the best.
+            while distance > 0:
+                if (best is not None and
+                        ((mismatch & ~fixable).bit_count(), length, index) >
+                        best[:3]):
+                    break
+
+                step = None
+                gain = 0
+
+                for delta in group:
+                    (_, condition_positive, condition_negative,
+                     _, _, fix, wrong) = delta
+
+                    if (mismatch & fix and
+                            positive & condition_positive == condition_positive
+                            and
+                            negative & condition_negative == condition_negative):
+                        new_gain = ((mismatch & fix).bit_count() -
+                                    (wrong & ~mismatch).bit_count())
+
+                        if new_gain > gain:
+                            step = delta
+                            gain = new_gain
+
+                if step is None:
+                    break
+
+                applies_positive, applies_negative = step[3:5]
+                positive = (positive | applies_positive) & ~applies_negative
+                negative = (negative & ~applies_positive) | applies_negative
+                mismatch = ((positive ^ target_positive) |
+                            (negative ^ target_negative))
+                distance -= gain
+                group.remove(step)
+                chosen.append(step[0])
+
+            if best is not None and (distance, length, index) > best[:3]:
+                continue
+
+            # The parser adds diacritics in list order, which only gives the
+            # same segment if they are still allowed in that order.
+            chosen.sort()
+
+            if self.compose(*self.bases[index][1:], chosen) != (positive,
+                                                                 negative):
+                continue
+
+            string = IPA + ''.join(self.diacritics[diacritic][0]
+                                   for diacritic in chosen)
+            key = (distance, len(string), index, string)
+
+            if best is None or key < best:
+                best = key
+
+        return best[3]
+
+
+def order_mask(features):
+    '''Convert a list of feature names into a mask with a bit for each
+    feature in feature_order, ignoring any other features.'''
+    return sum(1 << feature_order.index(feature) for feature in set(features)
+               if feature in feature_order)
+
+
+def string_masks(feature_string):
+    '''Convert a feature string into a tuple of (positive mask, negative
+    mask).'''
+    positive = 0
+    negative = 0
+
+    for index, value in enumerate(feature_string):
+        if value == '+':
+            positive |= 1 << index
+        elif value == '-':
+            negative |= 1 << index
+
+    return positive, negative
+
+
+def table_version(feature_strings):
+    '''Return a short hash of a feature string table, which identifies the
+    table in the keys of a deparse cache.'''
+    table = '\n'.join(','.join(row) for row in feature_strings)
+
+    return hashlib.sha1(table.encode('utf-8')).hexdigest()[:16]
+
+
+def segment_match(feature_strings, target_segment, cache=None):
     '''Returns the best match for the IPA string of the given Segment, from the
     given list of tuples containing feature strings. The first item in each
-    tuple is the phoneme and the second is the feature string.
+    tuple is the phoneme and the second is the feature string. A FeatureIndex
+    of the list may be given instead, which finds the same match faster, or a
+    DecompositionIndex.
+
+    Matches are stored in the given LRUCache, or the global deparse_cache,
+    keyed by the version of the table and the feature string. The version of
+    a plain list isn't computed, so a cache should only be shared between
+    lists if they're the same table.
 
     '''
+    if cache is None:
+        cache = deparse_cache
+
     target_feature_string = feature_string(target_segment)
+    version = getattr(feature_strings, 'version', None)
+    key = (version, target_feature_string)
 
     # If the segment has previously been matched, return the cached value
-    if target_feature_string in deparse_cache:
-        return deparse_cache[target_feature_string]
+    deparsed_segment = cache.get(key)
+
+    if deparsed_segment is not None:
+        return deparsed_segment
+
+    if isinstance(feature_strings, (FeatureIndex, DecompositionIndex)):
+        deparsed_segment = feature_strings.nearest(target_feature_string)
+        cache[key] = deparsed_segment
+
+        return deparsed_segment
 
     # Find the distance of the initial candidate to serve as a benchmark.
     best_distance = hamming(target_feature_string, feature_strings[0][1])
@@ -84,7 +535,7 @@ def segment_match(feature_strings, target_segment):
     deparsed_segment = min(best_strings, key=len)
 
     # Add the new match to the cache.
-    deparse_cache[target_feature_string] = deparsed_segment
+    cache[key] = deparsed_segment
 
     return deparsed_segment
 
@@ -93,17 +544,68 @@ def initialise_cache():
     '''Creates the global cache for deparsing, where segment matches will be
     stored.'''
     global deparse_cache
-    deparse_cache = {}
+    deparse_cache = LRUCache(deparse_cache_size)
+
+
+initialise_cache()
+
+
+def match_segments(words, index, cache):
+    '''Find the matches of the distinct segments of the words which aren't in
+    the cache, and add them to it. When there are enough of them, and NumPy is
+    installed, they are matched in one batch. Only a FeatureIndex can be
+    matched in a batch.'''
+    # Imported here because segment, which vectorised depends on, imports
+    # this module.
+    import vectorised
+
+    if vectorised.numpy is None or not isinstance(index, FeatureIndex):
+        return
+
+    # Changed words in a Lexicon are kept in its overlay, and may contain
+    # segments which aren't in its table.
+    if hasattr(words, 'join_segments'):
+        segments = set(words.segments)
+        segments.update(segment for word in words.overlay.values()
+                        for segment in word.segments)
+    else:
+        segments = {segment for word in words for segment in word.segments}
 
+    strings = {feature_string(segment) for segment in segments}
+    unmatched = [string for string in strings
+                 if (index.version, string) not in cache]
 
-def deparse_words(words, segments, feature_strings):
-    '''Given a list of Words, return a list of IPA strings, one for each
-    word.'''
-    initialise_cache()
+    if not vectorised.deparse_enabled(unmatched, index):
+        return
+
+    matches = vectorised.nearest_feature_strings(unmatched, index)
+
+    for string, match in zip(unmatched, matches):
+        cache[(index.version, string)] = match
+
+
+def deparse_words(words, segments, feature_strings, cache=None):
+    '''Given a list or Lexicon of Words, return a list of IPA strings, one for
+    each word. The feature strings may be a list, a FeatureIndex or a
+    DecompositionIndex. Segment matches are kept in the given LRUCache between
+    calls. Without one, they are only kept for this call, so that concurrent
+    calls never share the global deparse_cache.'''
+    if not isinstance(feature_strings, (FeatureIndex, DecompositionIndex)):
+        feature_strings = FeatureIndex(feature_strings)
+
+    if cache is None:
+        cache = LRUCache(deparse_cache_size)
+
+    match_segments(words, feature_strings, cache)
 
     # Partially apply the segment_match function to avoid repeated calls with
     # the feature_strings object.
-    deparse = partial(segment_match, feature_strings)
+    deparse = partial(segment_match, feature_strings, cache=cache)
+
+    # A Lexicon stores each distinct segment once, so it is deparsed one
+    # segment at a time rather than one word at a time.
+    if hasattr(words, 'join_segments'):
+        return words.join_segments(deparse)
 
     # Deparse each segment in each word
     word_strings = [''.join(deparse(segment) for segment in word.segments)
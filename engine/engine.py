@@ -1,150 +1,144 @@
-import csv
-import yaml
+import os
+import re
 import sys
+import atexit
+import threading
 import os.path as path
-import copy
 
 import parse
 import deparse
 import evolve
 import metrics
+import lexicon
+import vectorised
+import parallel
+import bundle
+from cache import LRUCache
+from rule import compile_rules, reverse_rule
 
 base_directory = path.dirname(path.dirname(path.abspath(__file__)))
 sys.path.append(path.join(base_directory, 'engine'))
 
-segments_path = path.join(base_directory, 'engine', 'data', 'features.csv')
-with open(segments_path, 'r', encoding='utf-8') as f:
-    segments = [segment for segment in csv.DictReader(f)]
 
-diacritics_path = path.join(base_directory, 'engine', 'data',
-                            'diacritics.yaml')
-with open(diacritics_path, 'r', encoding='utf-8') as f:
-    diacritics = yaml.load(f)
+# Compiled transcription transducers, keyed by the direction and the tuple of
+# transcription rules, so each set of rules is only compiled once.
+transducer_cache = LRUCache(64)
 
-rules_path = path.join(base_directory, 'engine', 'data', 'rules.yaml')
-with open(rules_path, 'r', encoding='utf-8') as f:
-    rules = yaml.load(f)
 
-feature_strings_path = path.join(base_directory, 'engine', 'data',
-                                 'feature-strings.csv')
-with open(feature_strings_path, 'r', encoding='utf-8') as f:
-    feature_strings = [line for line in csv.reader(f)]
+def trie_pattern(node):
+    '''Convert a trie of strings, as built by parse.build_trie, into a regular
+    expression which matches the longest string in the trie at a position.
+    The characters after a node are optional where a string ends at it, and
+    are tried first.'''
+    branches = [re.escape(character) + trie_pattern(child)
+                for character, child in node.items() if character is not None]
 
+    if not branches:
+        return ''
 
-def rewrite(words, rules, to='ipa'):
-    '''Rewrite a list of words according to a list of tuple rules of form
-    (plain, ipa), in direction given by target.'''
-
-    if len(rules) == 0:
-        return words
+    if len(branches) == 1:
+        pattern = branches[0]
+    else:
+        pattern = '(?:' + '|'.join(branches) + ')'
 
-    rewritten_words = []
+    if None in node:
+        return '(?:' + pattern + ')?'
 
-    # The code duplication here, however ugly, is faster because it limits
-    # the amount of conditionals.
-    if to == 'ipa':
-        for word in words:
-            for rule in rules:
-                word = word.replace(rule[0], rule[1])
+    return pattern
 
-            rewritten_words.append(word)
 
-    elif to == 'plain':
-        for word in words:
-            for rule in rules:
-                word = word.replace(rule[1], rule[0])
+def compile_transducer(rules, to='ipa'):
+    '''Compile a list of tuple rules of form (plain, ipa) into a transducer
+    which rewrites words in the direction given by to. The strings to be
+    replaced are built into a trie, which is converted into a single regular
+    expression, so words are rewritten by the compiled matcher of the re
+    module. Returns a tuple of (pattern, replacements), where replacements
+    maps each string onto its replacement. If several rules replace the same
+    string, the first one is used.'''
+    source, target = (0, 1) if to == 'ipa' else (1, 0)
+    replacements = {}
 
-            rewritten_words.append(word)
-
-    return rewritten_words
+    for rule in rules:
+        if rule[source]:
+            replacements.setdefault(rule[source], rule[target])
 
+    pattern = re.compile(trie_pattern(parse.build_trie(replacements)))
 
-def run_engine(words,
-               generations=5,
-               rewrite_rules=[],
-               reverse=False,
-               metric=metrics.phonetic_product,
-               optimisation_function=min):
-    '''Evolves the language specified by a list of word strings according to
-    parameters:
+    return pattern, replacements
 
-        generations: the maximum number of rules to apply during evolution.
-        rewrite_rules: a list of rewrite tuples in form (plain, ipa) which
-                       is used to transcribe the input words from orthographic
-                       representation to IPA.
-        reverse: if True, run the evolution in reverse.
-        metric: the metric function that will be used in selecting rules.
-        optimisation_function: the function that will determine the best
-                               metric result to use during selection. Should
-                               be either min or max.
 
-    Returns a list of evolved word strings and a list of applied rules.
+def get_transducer(rules, to='ipa'):
+    '''Return the compiled transducer for the rules and direction, from the
+    cache if the same rules have been compiled before.'''
+    key = (to, tuple(tuple(rule) for rule in rules))
+    transducer = transducer_cache.get(key)
 
-    '''
-    # Apply the given transcription rules
-    words = rewrite(words, rewrite_rules, to='ipa')
+    if transducer is None:
+        transducer = compile_transducer(rules, to)
+        transducer_cache[key] = transducer
 
-    # Parse the word strings into Word objects
-    parsed_words = parse.parse_words(words, segments, diacritics)
+    return transducer
 
-    if reverse:
-        evolution_function = evolve_words_reverse
-    else:
-        evolution_function = evolve_words
 
-    # Evolve the words for the given number of generations
-    evolved_words, applied_rules = evolution_function(
-        parsed_words, rules, generations, metric, optimisation_function)
+def rewrite(words, rules, to='ipa'):
+    '''Rewrite a list of words according to a list of tuple rules of form
+    (plain, ipa), in direction given by target. Each word is rewritten in one
+    pass, replacing the longest matching string at each position, so the
+    result doesn't depend on the order of the rules and a replacement is
+    never rewritten again.'''
 
-    # Deparse the evolved words into strings
-    deparsed_words = deparse.deparse_words(evolved_words, segments,
-                                           feature_strings)
+    if len(rules) == 0:
+        return words
 
-    # Convert back to orthographic representation using the given transcription
-    # rules
-    deparsed_words = rewrite(deparsed_words, rewrite_rules, to='plain')
+    pattern, replacements = get_transducer(rules, to)
 
-    return deparsed_words, applied_rules
+    if not replacements:
+        return list(words)
 
+    def replace(match):
+        return replacements[match.group()]
 
-def evolve_words(words, rules, generations, metric, optimisation_function):
-    '''Evolves the given list of words according to the given list of rules, for a
-    number of generations. If no more applicable rules are available, the
-    evolution will stop early. Returns the evolved list of words and a list of
-    rule which were applied.
+    return [pattern.sub(replace, word) for word in words]
 
-    '''
-    applied_rules = []
 
-    # Create a mutable copy of the global rules list, from which rules
-    # are deleted to ensure they run only once.
-    available_rules = copy.deepcopy(rules)
+def create_table(words, rules, metric, counts=None, workers=None,
+                 budget=None):
+    '''Create the table of rule sites and scores used during evolution, which
+    is computed across a pool of processes if workers is given.'''
+    if workers:
+        return parallel.ParallelRuleTable(words, rules, metric, counts,
+                                          workers, budget)
 
-    try:
-        for _ in range(generations):
-            rule, words = evolve.evolve(words, available_rules, metric,
-                                        optimisation_function)
+    return evolve.RuleTable(words, rules, metric, counts, budget)
 
-            applied_rules.append(rule)
-            available_rules.remove(rule)
 
-    # StopIteration is raised when there are no more applicable rules
-    except StopIteration:
-        return words, applied_rules
+def evolution_steps(table, generations, optimisation_function,
+                    selection='exhaustive', budget=None):
+    '''Apply the best rule in the table for each generation, yielding a tuple
+    of the applied rule and the sorted indices of the words it changed after
+    each one. The words of the table are up to date whenever a tuple is
+    yielded. Stops early if no more rules are applicable, or when the budget
+    is exhausted.'''
+    for _ in range(generations):
+        # The table is kept up to date after each generation, so the
+        # evolution can stop with the words evolved so far.
+        if budget is not None and budget.exhausted():
+            return
 
-    return words, applied_rules
+        # StopIteration is raised when there are no more applicable rules
+        try:
+            rule = table.select(optimisation_function, selection)
+        except StopIteration:
+            return
 
+        yield rule, table.apply(rule)
 
-def evolve_words_reverse(words, available_rules, generations, metric,
-                         optimisation_function):
-    '''Evolves the given list of words in reverse, according to the given list of
-    rules, for a number of generations. If no more applicable rules are
-    available, the evolution will stop early. Returns the evolved list of words
-    and a list of rule which were applied.
 
-    '''
-    # Transform each rule to its reversed equivalent
-    reverse_rules = list(map(reverse_rule, available_rules))
+def reverse_evolution(rules, optimisation_function):
+    '''Return the reversed equivalent of each compiled rule, and the inverse
+    optimisation function, which are used to evolve words in reverse.'''
+    # Use the precomputed reversed equivalent of each rule
+    reverse_rules = [rule.reversed for rule in rules]
 
     # Invert the optimisation algorithm
     if optimisation_function == min:
@@ -152,98 +146,373 @@ def evolve_words_reverse(words, available_rules, generations, metric,
     else:
         optimisation_function = min
 
-    applied_rules = []
+    return reverse_rules, optimisation_function
+
+
+def evolve_words(words, rules, generations, metric, optimisation_function,
+                 selection='exhaustive', counts=None, workers=None,
+                 beam_width=4, beam_candidates=16, budget=None):
+    '''Evolves the given list of words according to the given list of compiled
+    rules, for a number of generations. If no more applicable rules are
+    available, the evolution will stop early. The selection method, workers,
+    beam and budget arguments are described in run_engine. If counts is
+    given, it contains the number of times each word occurs, which weights
+    the metric. Returns the evolved list of words and a list of rule which
+    were applied.
+
+    '''
+    if selection == 'beam':
+        if workers:
+            raise ValueError('Beam search cannot be run with workers')
+
+        return evolve.beam_search(words, rules, generations, metric,
+                                  optimisation_function, counts, beam_width,
+                                  beam_candidates, budget)
+
+    # The table keeps the sites and scores of the available rules between
+    # generations, and removes each rule once applied to ensure it runs only
+    # once.
+    table = create_table(words, rules, metric, counts, workers, budget)
 
     try:
-        for _ in range(generations):
-            rule, words = evolve.evolve(words, reverse_rules, metric,
-                                        optimisation_function)
-            applied_rules.append(rule)
-            reverse_rules.remove(rule)
+        applied_rules = [rule for rule, _ in evolution_steps(
+            table, generations, optimisation_function, selection, budget)]
+    finally:
+        table.close()
+
+    return table.words, applied_rules
 
-    # StopIteration is raised when there are no more applicable rules
-    except StopIteration:
-        return words, list(reversed(applied_rules))
+
+def evolve_words_reverse(words, available_rules, generations, metric,
+                         optimisation_function, selection='exhaustive',
+                         counts=None, workers=None, beam_width=4,
+                         beam_candidates=16, budget=None):
+    '''Evolves the given list of words in reverse, according to the given list of
+    compiled rules, for a number of generations. If no more applicable rules
+    are available, the evolution will stop early. The selection method,
+    workers, beam and budget arguments are described in run_engine. If
+    counts is given, it contains the number of times each word occurs, which
+    weights the metric. Returns the evolved list of words and a list of rule
+    which were applied.
+
+    '''
+    reverse_rules, optimisation_function = reverse_evolution(
+        available_rules, optimisation_function)
+
+    words, applied_rules = evolve_words(
+        words, reverse_rules, generations, metric, optimisation_function,
+        selection, counts, workers, beam_width, beam_candidates, budget)
 
     # When returning, the applied rules list is reversed due to the reverse
     # chronological order.
     return words, list(reversed(applied_rules))
 
 
-def reverse_rule(rule):
-    '''Given a rule dictionary, transform it so that it applies the rule in
-    reverse.'''
-    reversed_rule = {'name': rule['name'], 'description': rule['description']}
+class Engine:
+    '''The engine, owning its data, compiled rules and caches. The data is
+    loaded the first time it is needed, from the precompiled bundle, or from
+    the given source files, so engines for different rule and feature
+    datasets can be used side by side. An Engine can be shared between
+    threads: its data isn't modified once loaded, and its caches are locked.
+
+        data: a bundle.Bundle to use, instead of loading one.
+        sources: a dictionary of source files, in the same format as
+                 bundle.sources, to load the data from.
+        bundle_path: the file the compiled data is stored in. If sources are
+                     given without a bundle path, the data is compiled in
+                     memory.
+        deparse_mode: 'table' to deparse segments by matching them against
+                      the feature strings table, or 'decomposition' to
+                      deparse them into a base segment and diacritics.
+        deparse_cache: the LRUCache of segment matches, which may be shared
+                       with other engines.
 
-    # Before and after conditions are unchanged
-    if 'before' in rule:
-        reversed_rule['before'] = rule['before']
-    if 'after' in rule:
-        reversed_rule['after'] = rule['after']
+    '''
 
-    # Invert application
-    new_applies = {}
-    if 'positive' in rule['applies']:
-        new_applies['negative'] = list(set(rule['applies']['positive']))
+    def __init__(self, data=None, sources=None, bundle_path=None,
+                 deparse_mode='table', deparse_cache=None):
+        self._data = data
+        self.sources = sources
+        self.bundle_path = bundle_path
+        self.deparse_mode = deparse_mode
+
+        if deparse_cache is None:
+            deparse_cache = LRUCache(deparse.deparse_cache_size)
+
+        self.deparse_cache = deparse_cache
+        self.lock = threading.Lock()
+
+    @property
+    def data(self):
+        '''The Bundle of engine data, which is loaded on first use.'''
+        if self._data is None:
+            with self.lock:
+                if self._data is None:
+                    if self.sources is None:
+                        self._data = bundle.load(self.bundle_path or
+                                                 bundle.bundle_path)
+                    elif self.bundle_path is None:
+                        self._data = bundle.read_sources(self.sources)
+                    else:
+                        self._data = bundle.load(self.bundle_path,
+                                                 self.sources)
+
+        return self._data
+
+    @property
+    def deparse_index(self):
+        '''The index used to match segments when deparsing.'''
+        if self.deparse_mode == 'decomposition':
+            return self.data.decomposition_index
+
+        return self.data.feature_index
+
+    def _parse_words(self, words, rewrite_rules):
+        '''Collapse repeated word strings, transcribe them into IPA with the
+        rewrite rules and parse them. Returns a tuple of the Lexicon of unique
+        parsed words, and the counts and order returned by
+        lexicon.collapse.'''
+
+        # Collapse repeated words, so each unique word is only processed once.
+        # The number of occurrences is used to weight the metric.
+        words, counts, order = lexicon.collapse(words)
+
+        # Apply the given transcription rules
+        words = rewrite(words, rewrite_rules, to='ipa')
+
+        # Parse the word strings into a compact Lexicon of Word objects
+        data = self.data
+        parsed_words = parse.parse_words(words, data.segments,
+                                         data.diacritics, lexicon.Lexicon(),
+                                         data.parse_context)
+
+        return parsed_words, counts, order
+
+    def run_engine(self, words,
+                   generations=5,
+                   rewrite_rules=[],
+                   reverse=False,
+                   metric=metrics.phonetic_product,
+                   optimisation_function=min,
+                   selection='exhaustive',
+                   workers=None,
+                   beam_width=4,
+                   beam_candidates=16,
+                   budget=None):
+        '''Evolves the language specified by a list of word strings according
+        to parameters:
+
+            generations: the maximum number of rules to apply during
+                         evolution.
+            rewrite_rules: a list of rewrite tuples in form (plain, ipa) which
+                           is used to transcribe the input words from
+                           orthographic representation to IPA.
+            reverse: if True, run the evolution in reverse.
+            metric: the metric function that will be used in selecting rules.
+            optimisation_function: the function that will determine the best
+                                   metric result to use during selection.
+                                   Should be either min or max.
+            selection: 'exhaustive' to compare every applicable rule in each
+                       generation, or 'lazy' to keep a heap of rule scores and
+                       rescore only the rules affected by the previous
+                       generation. Both select the same rules, but 'lazy'
+                       requires min or max as the optimisation function.
+                       'beam' keeps the best beam_width sequences of rules,
+                       by the average metric value of the whole lexicon,
+                       instead of only the best rule of each generation. It
+                       also requires min or max, and can't be used with
+                       workers.
+            workers: if given, the number of processes used to score rules in
+                     parallel. The metric must be picklable. The result is the
+                     same as the serial evolution.
+            beam_width: the number of sequences of rules kept by beam
+                        selection in each generation.
+            beam_candidates: the number of the best rules of each sequence
+                             considered by beam selection in each generation.
+            budget: if given, an evolve.Budget limiting the time and the
+                    number of rule evaluations spent on the evolution. It
+                    is also checked while the rule table is filled and
+                    updated. When it runs out, the words and the rules
+                    applied so far are returned, and its truncated
+                    attribute is set.
+
+        Returns a list of evolved word strings and a list of applied rules.
+
+        '''
+        parsed_words, counts, order = self._parse_words(words, rewrite_rules)
+        data = self.data
+
+        if reverse:
+            evolution_function = evolve_words_reverse
+        else:
+            evolution_function = evolve_words
+
+        # Evolve the words for the given number of generations
+        evolved_words, applied_rules = evolution_function(
+            parsed_words, data.compiled_rules, generations, metric,
+            optimisation_function, selection, counts, workers, beam_width,
+            beam_candidates, budget)
+
+        # Deparse the evolved words into strings
+        deparsed_words = deparse.deparse_words(evolved_words, data.segments,
+                                               self.deparse_index,
+                                               self.deparse_cache)
+
+        # Convert back to orthographic representation using the given
+        # transcription rules
+        deparsed_words = rewrite(deparsed_words, rewrite_rules, to='plain')
+
+        # Expand the unique words back into the original order
+        deparsed_words = lexicon.expand(deparsed_words, order)
+
+        return deparsed_words, [rule.rule for rule in applied_rules]
+
+    def iter_engine(self, words,
+                    generations=5,
+                    rewrite_rules=[],
+                    reverse=False,
+                    metric=metrics.phonetic_product,
+                    optimisation_function=min,
+                    selection='exhaustive',
+                    workers=None,
+                    budget=None):
+        '''Evolve the language specified by a list of word strings in the same
+        way as run_engine, yielding the result of each generation as it is
+        found instead of returning once all generations are complete. Beam
+        selection isn't supported, since it doesn't choose the rules of a
+        generation until the end.
+
+        Yields a tuple for each generation of (generation, rule, changed,
+        changed words), where generation counts from 1, rule is the applied
+        rule, changed is a sorted list of the indices of the input words
+        which the rule changed, and changed words is the list of their new
+        word strings. Only the changed words are deparsed. In reverse, the
+        rules are yielded in the order they are found, which is the reverse
+        of the order returned by run_engine.
+
+        The evolution stops if the generator is closed, such as when the
+        consumer stops iterating over it.
+
+        '''
+        if selection == 'beam':
+            raise ValueError('Beam selection cannot be iterated')
+
+        parsed_words, counts, order = self._parse_words(words, rewrite_rules)
+        data = self.data
+
+        # The positions of the original words of each unique word
+        positions = [[] for _ in parsed_words]
+
+        for position, index in enumerate(order):
+            positions[index].append(position)
+
+        rules = data.compiled_rules
+
+        if reverse:
+            rules, optimisation_function = reverse_evolution(
+                rules, optimisation_function)
+
+        table = create_table(parsed_words, rules, metric, counts, workers,
+                             budget)
+
+        try:
+            for generation, (rule, changed) in enumerate(
+                    evolution_steps(table, generations, optimisation_function,
+                                    selection, budget), 1):
+                # Deparse the changed words, and convert them back to their
+                # orthographic representation
+                deparsed_words = deparse.deparse_words(
+                    [table.words[index] for index in changed], data.segments,
+                    self.deparse_index, self.deparse_cache)
+                deparsed_words = rewrite(deparsed_words, rewrite_rules,
+                                         to='plain')
+
+                # Expand the changed unique words into the original words
+                changed_words = sorted(
+                    (position, word)
+                    for index, word in zip(changed, deparsed_words)
+                    for position in positions[index])
+
+                yield (generation, rule.rule,
+                       [position for position, _ in changed_words],
+                       [word for _, word in changed_words])
+
+        finally:
+            table.close()
+
+    def apply_rules(self, words, rules, rewrite_rules=[], reverse=False):
+        '''Given a list of word strings and a list of rules, apply each rule to
+        the words and return the new word strings.'''
+
+        parsed_words, _, order = self._parse_words(words, rewrite_rules)
+        data = self.data
+
+        # Compile the rules once, rather than for every word. The rules come
+        # from the caller, so features unknown to the engine are rejected
+        # rather than given new bits.
+        rules = compile_rules(rules, new_features=False)
+
+        # If reversed, apply in reverse order
+        if reverse:
+            rules = rules[::-1]
+
+        # Apply each rule in sequence
+        if vectorised.enabled(parsed_words, rules):
+            parsed_words = vectorised.apply_rules(parsed_words, rules)
+        else:
+            for rule in rules:
+                parsed_words = [word.apply_rule(rule)
+                                for word in parsed_words]
 
-    if 'negative' in rule['applies']:
-        new_applies['positive'] = list(set(rule['applies']['negative']))
+        parsed_words = lexicon.Lexicon(parsed_words)
 
-    # The new conditions are the same as the old application features.
-    # We must use a deep copy to prevent in-place modification.
-    new_conditions = copy.deepcopy(rule['applies'])
+        # Deparse the evolved words into strings
+        deparsed_words = deparse.deparse_words(parsed_words, data.segments,
+                                               self.deparse_index,
+                                               self.deparse_cache)
 
-    # Construct set containing all features present in the new conditions.
-    new_conditions_set = set(
-        new_conditions.get('positive', []) + new_conditions.get('negative',
-                                                                []))
+        # Convert back to orthographic representation using the given
+        # transcription rules
+        deparsed_words = rewrite(deparsed_words, rewrite_rules, to='plain')
 
-    # For each feature in the old conditions, if it isn't in the new conditions
-    # add it, keeping the same polarity. This catches conditions that aren't
-    # changed by the rule.
-    for feature in rule['conditions'].get('positive', []):
-        if feature not in new_conditions_set:
-            if 'positive' in new_conditions:
-                new_conditions['positive'].append(feature)
-            else:
-                new_conditions['positive'] = [feature]
-    for feature in rule['conditions'].get('negative', []):
-        if feature not in new_conditions_set:
-            if 'negative' in new_conditions:
-                new_conditions['negative'].append(feature)
-            else:
-                new_conditions['negative'] = [feature]
+        # Expand the unique words back into the original order
+        return lexicon.expand(deparsed_words, order)
 
-    reversed_rule['conditions'] = new_conditions
-    reversed_rule['applies'] = new_applies
 
-    return reversed_rule
+# The engine used by the module level functions. Setting DEPARSE_MODE to
+# decomposition changes its deparse mode. If DEPARSE_CACHE_PATH is set, its
+# cache of segment matches is warmed from a snapshot at that path when the
+# engine is loaded, and the snapshot is rewritten when the process exits.
+# Under uwsgi the engine is loaded by the master process, so every worker
+# starts with the warm cache.
+default_engine = Engine(deparse_mode=os.environ.get('DEPARSE_MODE', 'table'))
+deparse_cache_path = os.environ.get('DEPARSE_CACHE_PATH')
 
+if deparse_cache_path:
+    default_engine.deparse_cache.load(deparse_cache_path)
+    atexit.register(default_engine.deparse_cache.save, deparse_cache_path)
 
-def apply_rules(words, rules, rewrite_rules=[], reverse=False):
-    '''Given a list of word strings and a list of rules, apply each rule to the
-    words and return the new word strings.'''
 
-    # Apply the given transcription rules
-    words = rewrite(words, rewrite_rules, to='ipa')
+def __getattr__(name):
+    '''Look up the attributes of the default engine's data, such as
+    engine.rules, as if they were module attributes.'''
+    if name in bundle.Bundle.__slots__:
+        return getattr(default_engine.data, name)
 
-    # Parse the word strings into Word objects
-    parsed_words = parse.parse_words(words, segments, diacritics)
+    raise AttributeError('module {0!r} has no attribute {1!r}'.format(
+        __name__, name))
 
-    # If reversed, apply in reverse order
-    if reverse:
-        rules = reversed(rules)
 
-    # Apply each rule in sequence
-    for rule in rules:
-        parsed_words = [word.apply_rule(rule) for word in parsed_words]
+def run_engine(*args, **kwargs):
+    '''Run Engine.run_engine on the default engine.'''
+    return default_engine.run_engine(*args, **kwargs)
+
 
-    # Deparse the evolved words into strings
-    deparsed_words = deparse.deparse_words(parsed_words, segments,
-                                           feature_strings)
+def iter_engine(*args, **kwargs):
+    '''Run Engine.iter_engine on the default engine.'''
+    return default_engine.iter_engine(*args, **kwargs)
 
-    # Convert back to orthographic representation using the given transcription
-    # rules
-    deparsed_words = rewrite(deparsed_words, rewrite_rules, to='plain')
 
-    return deparsed_words
+def apply_rules(*args, **kwargs):
+    '''Run Engine.apply_rules on the default engine.'''
+    return default_engine.apply_rules(*args, **kwargs)
@@ -1,4 +1,11 @@
+import copy
+import time
+import heapq
+
 import metrics
+from rule import compile_rule
+from lexicon import Lexicon
+import vectorised
 
 
 def filter_rules(words, rules):
@@ -6,33 +13,134 @@ def filter_rules(words, rules):
     applicable to the given words.
 
     '''
+    if vectorised.enabled(words, rules):
+        return vectorised.filter_rules(words, rules)
+
     return [rule for rule in rules
             if any(word.applicable(rule) for word in words)]
 
 
-def get_metric_from_changed_words(words, rule, metric):
+def find_sites(words, rule):
+    '''Given a list of words and a rule, return a dictionary mapping the index of
+    each word the rule applies to onto the list of sites where it applies, as
+    returned by Word.match_sites.
+
+    '''
+    sites = {}
+
+    for index, word in enumerate(words):
+        word_sites = word.match_sites(rule)
+
+        if word_sites:
+            sites[index] = word_sites
+
+    return sites
+
+
+def find_applicable_rules(words, rules):
+    '''Given a list of words and a list of rules, return a list of (rule, sites)
+    tuples for the rules which are applicable to the given words, where sites
+    is the result of find_sites.
+
+    '''
+    if vectorised.enabled(words, rules):
+        return vectorised.find_applicable_rules(words, rules)
+
+    applicable_rules = []
+
+    for rule in rules:
+        sites = find_sites(words, rule)
+
+        if sites:
+            applicable_rules.append((rule, sites))
+
+    return applicable_rules
+
+
+def apply_at_sites(words, rule, sites):
+    '''Given a list of words, a rule and the sites found by find_sites, return a
+    dictionary mapping the index of each changed word onto the new word.'''
+    return {index: words[index].apply_at(word_sites, rule)
+            for index, word_sites in sites.items()}
+
+
+def get_metric_from_changed_words(words, rule, metric, sites=None):
     '''Given a list of words and a rule, apply the rule to the words. Return the
     value of the metric applied to the list of all words that changed. This
     produces the same result as applying the metric to all words, in terms of
-    comparison to other rules, but it's faster.'''
+    comparison to other rules, but it's faster. If the sites of the rule have
+    already been found, they can be given to avoid searching again.'''
+
+    if sites is None:
+        sites = find_sites(words, rule)
 
-    changed_words = [word.apply_rule(rule) for word in words if
-                     word.applicable(rule)]
+    changed_words = list(apply_at_sites(words, rule, sites).values())
 
     return average_metric_value(changed_words, metric)
 
 
-def average_metric_value(words, metric):
+def score_sites(words, rule, sites, metric, states=None):
+    '''Given a list of words, a rule and the sites found by find_sites, return
+    a dictionary mapping the index of each changed word onto a tuple of its
+    sites and the metric value of the changed word.
+
+    If states is given, it is a dictionary mapping the index of each word onto
+    a tuple of the word and its metric state, as returned by
+    metrics.metric_state, which is filled in as they are needed. Decomposable
+    metrics are then updated from the state of each word and the masks of the
+    segments the rule replaces, rather than computed again over the whole
+    changed word. Rules which delete segments are always computed in
+    full.'''
+    if (states is not None and not rule.deletion and
+            metric in metrics.decomposable_metrics):
+        entries = {}
+
+        for index, word_sites in sites.items():
+            # The word is kept with its state, which saves looking it up
+            # in a Lexicon again.
+            cached = states.get(index)
+
+            if cached is None:
+                word = words[index]
+                cached = (word, metrics.metric_state(metric, word))
+                states[index] = cached
+
+            word, state = cached
+            entries[index] = (word_sites, metrics.changed_value(
+                metric, state, word_sites,
+                word.replaced_masks(word_sites, rule)))
+
+        return entries
+
+    indices = list(sites)
+    values = metrics.metric_values(metric,
+                                   [words[index].apply_at(sites[index], rule)
+                                    for index in indices])
+
+    return {index: (sites[index], value)
+            for index, value in zip(indices, values)}
+
+
+def average_metric_value(words, metric, counts=None):
     '''Apply the metric function to each word in words, returning the average
-    result.'''
-    return sum(map(metric, words)) / len(words)
+    result. If counts is given, it contains the number of times each word
+    occurs, and the average is weighted accordingly.'''
+    values = metrics.metric_values(metric, words)
+
+    if counts is None:
+        return sum(values) / len(words)
+
+    return (sum(value * count for value, count in zip(values, counts)) /
+            sum(counts))
 
 
 def evolve(words, rules, metric, optimisation_function):
     '''Evolve a list of Words, returning the applied rule and the new list of
     Words.'''
 
-    rules = filter_rules(words, rules)
+    # Find the sites of every rule once. They are reused when scoring the
+    # rules and when applying the best rule.
+    rules = find_applicable_rules(words, rules)
 
     # If there are no applicable rules, inform the evolution controller
     if len(rules) == 0:
@@ -40,17 +148,537 @@ def evolve(words, rules, metric, optimisation_function):
 
     # Establish a baseline for evolution effectiveness using the first
     # available rule.
-    best_rule = rules[0]
-    best_metric = get_metric_from_changed_words(words, rules[0], metric)
+    best_rule, best_sites = rules[0]
+    best_changes = apply_at_sites(words, best_rule, best_sites)
+    best_metric = average_metric_value(list(best_changes.values()), metric)
 
     # Loop through the rest of the rules. If a rule is better than the
     # current best, it becomes the new best.
-    for rule in rules[1:]:
-        new_metric = get_metric_from_changed_words(words, rule, metric)
+    for rule, sites in rules[1:]:
+        changes = apply_at_sites(words, rule, sites)
+        new_metric = average_metric_value(list(changes.values()), metric)
 
         if optimisation_function(new_metric, best_metric) == new_metric:
             best_metric = new_metric
             best_rule = rule
+            best_changes = changes
+
+    # Return the best rule and the words with the best rule applied, reusing
+    # the words changed while scoring it.
+    return best_rule, [best_changes.get(index, word)
+                       for index, word in enumerate(words)]
+
+
+class Budget:
+    '''A limit on the time and work spent evolving a list of words. The
+    deadline is the number of seconds from the creation of the budget, and
+    evaluations is the number of times the entries of a rule can be computed
+    for a set of words. Either may be None, for no limit.
+
+    The budget is checked before each rule while a RuleTable is filled or
+    updated, and between generations. When it runs out, the table is left
+    partly computed, and the evolution stops with the words and the rules
+    applied so far. The truncated attribute is set to True if this
+    happened.
+
+    '''
+
+    def __init__(self, deadline=None, evaluations=None):
+        self.deadline = (None if deadline is None else
+                         time.monotonic() + deadline)
+        self.evaluations = evaluations
+        self.used = 0
+        self.truncated = False
+
+    def spend(self, evaluations=1):
+        '''Record the given number of rule evaluations.'''
+        self.used += evaluations
+
+    def exhausted(self):
+        '''Returns True if the deadline has passed or the evaluations have
+        been used up, and marks the evolution as truncated.'''
+        if ((self.deadline is not None and
+             time.monotonic() >= self.deadline) or
+                (self.evaluations is not None and
+                 self.used >= self.evaluations)):
+            self.truncated = True
+
+        return self.truncated
+
+
+class RuleTable:
+    '''A table of the sites and metric values of each available rule for each
+    word, which is kept between generations of an evolution. When a rule is
+    applied, only the rows of the words it changed are recomputed, rather than
+    checking every rule against every word again. If counts is given, it
+    contains the number of times each word occurs in the lexicon, and scores
+    are weighted accordingly. If budget is given, each computation of the
+    entries of a rule is recorded as an evaluation in it.'''
+
+    def __init__(self, words, rules, metric, counts=None, budget=None):
+        # A Lexicon is copied rather than converted into a list, so the words
+        # stay in its compact form and modified words go into its overlay.
+        if isinstance(words, Lexicon):
+            self.words = words.copy()
+        else:
+            self.words = list(words)
+
+        self.rules = [compile_rule(rule) for rule in rules]
+        self.metric = metric
+        self.counts = counts
+        self.budget = budget
+
+        # The metric state of each word, for decomposable metrics, which is
+        # kept until the word changes.
+        self.states = {}
+
+        # For each rule, a dictionary mapping the index of each word it applies
+        # to onto a tuple of the sites and the metric value of the changed
+        # word. Scores are None when they need to be recalculated.
+        self.entries = {}
+        self.scores = {}
+
+        # The position of each rule in the original list, and the number of
+        # times its entries have changed, which are used by lazy_best_rule to
+        # order the heap of scores and discard stale entries.
+        self.positions = {rule: position
+                          for position, rule in enumerate(self.rules)}
+        self.versions = dict.fromkeys(self.rules, 0)
+        self.dirty = set()
+        self.heap = []
+        self.heap_sign = 1
+
+        for rule in self.rules:
+            self.entries[rule] = {}
+
+        self.populate()
+
+    def exhausted(self):
+        '''Returns True if the budget of the table has run out.'''
+        return self.budget is not None and self.budget.exhausted()
+
+    def populate(self):
+        '''Fill the entries of every rule for the initial words. If the budget
+        runs out, the remaining rules are left without entries.'''
+
+        # For large lexicons, the sites of groups of rules are found at once
+        # with the vectorised backend, encoding the words once. The budget is
+        # checked before each group and each rule.
+        if vectorised.enabled(self.words, self.rules):
+            encoded = vectorised.encode(self.words)
+            size = vectorised.rule_group_size
+
+            for start in range(0, len(self.rules), size):
+                if self.exhausted():
+                    return
+
+                for rule, sites in vectorised.find_applicable_rules(
+                        self.words, self.rules[start:start + size], encoded):
+                    if self.exhausted():
+                        return
+
+                    self.fill(rule, sites)
+
+        else:
+            for rule in self.rules:
+                if self.exhausted():
+                    return
+
+                sites = find_sites(self.words, rule)
+
+                if sites:
+                    self.fill(rule, sites)
+
+    def fill(self, rule, sites):
+        '''Set the entries of the given rule from a dictionary of sites, as
+        returned by find_sites.'''
+        self.entries[rule] = score_sites(self.words, rule, sites, self.metric,
+                                         self.states)
+
+        if self.budget is not None:
+            self.budget.spend()
+
+        self.scores[rule] = None
+        self.versions[rule] += 1
+        self.dirty.add(rule)
+
+    def refresh(self, rule, indices, sites=None):
+        '''Recompute the entries of the given rule for the words at the given
+        indices. If sites is given, it is a dictionary of the sites already
+        found for those words, as returned by find_sites.'''
+        if sites is None:
+            sites = {}
+
+            for index in indices:
+                word_sites = self.words[index].match_sites(rule)
+
+                if word_sites:
+                    sites[index] = word_sites
+
+        new_entries = score_sites(self.words, rule, sites, self.metric,
+                                  self.states)
+
+        if self.budget is not None:
+            self.budget.spend()
+
+        self.replace(rule, indices, new_entries)
+
+    def replace(self, rule, indices, new_entries):
+        '''Replace the entries of the given rule for the words at the given
+        indices with new_entries, which is missing the indices of words the
+        rule no longer applies to.'''
+        entries = self.entries[rule]
+        changed = False
+
+        for index in indices:
+            if index in new_entries:
+                entries[index] = new_entries[index]
+                changed = True
+
+            elif index in entries:
+                del entries[index]
+                changed = True
+
+        if changed:
+            self.scores[rule] = None
+            self.versions[rule] += 1
+            self.dirty.add(rule)
+
+    def score(self, rule):
+        '''Return the average metric value of the words changed by the given
+        rule, as calculated by get_metric_from_changed_words.'''
+        if self.scores.get(rule) is None:
+            entries = self.entries[rule]
+            indices = sorted(entries)
+
+            # Sum in word order, so the result is identical to scoring the
+            # rule from scratch.
+            if self.counts is None:
+                self.scores[rule] = (sum(entries[index][1]
+                                         for index in indices) /
+                                     len(entries))
+
+            else:
+                counts = self.counts
+                self.scores[rule] = (sum(entries[index][1] * counts[index]
+                                         for index in indices) /
+                                     sum(counts[index] for index in indices))
+
+        return self.scores[rule]
+
+    def applicable_rules(self):
+        '''Return the available rules which apply to at least one word.'''
+        return [rule for rule in self.rules if self.entries[rule]]
+
+    def best_rule(self, optimisation_function):
+        '''Return the applicable rule with the best score, breaking ties in the
+        same way as evolve. Raises StopIteration if no rules are
+        applicable.'''
+        rules = self.applicable_rules()
+
+        # If there are no applicable rules, inform the evolution controller
+        if len(rules) == 0:
+            raise StopIteration
+
+        best_rule = rules[0]
+        best_metric = self.score(best_rule)
+
+        for rule in rules[1:]:
+            new_metric = self.score(rule)
+
+            if optimisation_function(new_metric, best_metric) == new_metric:
+                best_metric = new_metric
+                best_rule = rule
+
+        return best_rule
+
+    def lazy_best_rule(self, optimisation_function):
+        '''Return the same rule as best_rule, using a heap of scores which is
+        kept between generations instead of comparing every applicable rule.
+        Only the rules whose entries changed since the last call are rescored;
+        their old heap entries are discarded when they reach the top. The
+        optimisation function must be min or max.'''
+        if optimisation_function is min:
+            sign = 1
+        elif optimisation_function is max:
+            sign = -1
+        else:
+            raise ValueError('Lazy selection requires min or max as the '
+                             'optimisation function')
+
+        # If the optimisation function has changed, the heap is rebuilt.
+        if sign != self.heap_sign:
+            self.heap = []
+            self.heap_sign = sign
+            self.dirty.update(self.rules)
+
+        # Rescore the changed rules. The heap is ordered by score and then by
+        # reversed position, as later rules win ties in best_rule.
+        for rule in self.dirty:
+            if rule in self.entries and self.entries[rule]:
+                heapq.heappush(self.heap, (sign * self.score(rule),
+                                           -self.positions[rule],
+                                           self.versions[rule], rule))
+
+        self.dirty.clear()
+
+        # Discard entries for rules which have been applied, or which have
+        # changed since the entry was pushed.
+        while self.heap:
+            _, _, version, rule = self.heap[0]
+
+            if rule in self.entries and self.versions[rule] == version:
+                return rule
+
+            heapq.heappop(self.heap)
+
+        # If there are no applicable rules, inform the evolution controller
+        raise StopIteration
+
+    def select(self, optimisation_function, selection='exhaustive'):
+        '''Return the best rule, using best_rule if selection is 'exhaustive'
+        or lazy_best_rule if it is 'lazy'.'''
+        if selection == 'lazy':
+            return self.lazy_best_rule(optimisation_function)
+
+        return self.best_rule(optimisation_function)
+
+    def changes(self, rule):
+        '''Return a dictionary mapping the index of each word the given rule
+        would modify onto the modified word, without applying the rule.'''
+        changes = {}
+        entries = self.entries[rule]
+
+        for index in sorted(entries):
+            sites = entries[index][0]
+            new_word = self.words[index].apply_at(sites, rule)
+
+            if new_word != self.words[index]:
+                changes[index] = new_word
+
+        return changes
+
+    def apply(self, rule, changes=None):
+        '''Apply the given rule to the words and remove it from the available
+        rules. The rows of the words it modified are recomputed for every
+        remaining rule. If changes is given, it is the result of calling
+        changes for the rule. Returns a sorted list of the indices of the
+        modified words.'''
+        if changes is None:
+            changes = self.changes(rule)
+
+        self.rules.remove(rule)
+        self.dirty.discard(rule)
+        del self.scores[rule]
+        del self.entries[rule]
+
+        changed = sorted(changes)
+
+        for index in changed:
+            self.words[index] = changes[index]
+            self.states.pop(index, None)
+
+        self.update(rule, changed)
+
+        return changed
+
+    def copy(self):
+        '''Return a copy of the table, which can be applied independently of
+        this one. The entries themselves are shared, as they are replaced
+        rather than modified.'''
+        table = copy.copy(self)
+
+        if isinstance(self.words, Lexicon):
+            table.words = self.words.copy()
+        else:
+            table.words = list(self.words)
+
+        table.rules = list(self.rules)
+        table.states = dict(self.states)
+        table.entries = {rule: dict(entries)
+                         for rule, entries in self.entries.items()}
+        table.scores = dict(self.scores)
+        table.versions = dict(self.versions)
+        table.dirty = set(self.dirty)
+        table.heap = list(self.heap)
+
+        return table
+
+    def update(self, rule, changed):
+        '''Recompute the rows of the words at the changed indices for every
+        remaining rule, after the given rule was applied. If the budget runs
+        out, the rows of the remaining rules are left out of date, and no
+        more rules should be selected from the table.'''
+        changed_words = [self.words[index] for index in changed]
+
+        # If many words changed, the vectorised backend finds the sites of
+        # every remaining rule in them at once.
+        if vectorised.enabled(changed_words, self.rules):
+            matches = vectorised.match(changed_words, self.rules)
+
+            for position, remaining_rule in enumerate(self.rules):
+                if self.exhausted():
+                    return
+
+                sites = vectorised.sites_from_matches(matches[position])
+                self.refresh(remaining_rule, changed,
+                             {changed[row]: word_sites
+                              for row, word_sites in sites.items()})
+
+        else:
+            for remaining_rule in self.rules:
+                if self.exhausted():
+                    return
+
+                self.refresh(remaining_rule, changed)
+
+    def close(self):
+        '''Release any resources held by the table.'''
+        pass
+
+
+def lexicon_hash(words):
+    '''Return a hash of the contents of a list of words, combined from a hash
+    of each word and its index, so it can be updated as words change.'''
+    value = 0
+
+    for index, word in enumerate(words):
+        value ^= hash((index, word))
+
+    return value
+
+
+def beam_search(words, rules, generations, metric, optimisation_function,
+                counts=None, width=4, candidates=16, budget=None):
+    '''Evolve a list of Words for a number of generations, keeping the width
+    best sequences of rules rather than only the best rule of each
+    generation. A sequence is ranked by the average metric value of every
+    word in its lexicon, weighted by counts if it is given, which is kept up
+    to date from the entries of each applied rule. In each generation, only
+    the best candidates rules of each sequence are considered, so the cost is
+    bounded by width times the cost of the greedy evolution. The
+    optimisation function must be min or max.
+
+    States are remembered by a hash of the contents of the lexicon and the
+    set of applied rules, so a state reached by several sequences, such as
+    the same rules applied in a different order, is only evaluated for the
+    best of them.
+
+    Sequences which run out of applicable rules are dropped unless every
+    sequence does. If a Budget is given, the search stops when it is
+    exhausted. Returns the evolved list of words and the list of applied
+    rules of the best sequence.
+
+    '''
+    if optimisation_function is min:
+        sign = 1
+    elif optimisation_function is max:
+        sign = -1
+    else:
+        raise ValueError('Beam search requires min or max as the '
+                         'optimisation function')
+
+    table = RuleTable(words, rules, metric, counts, budget)
+
+    # Every table copied from this one shares its budget
+    exhausted = table.exhausted
+
+    if exhausted():
+        return table.words, []
+
+    if counts is None:
+        counts = [1] * len(table.words)
+
+    # The average metric value of a lexicon is its total divided by the sum
+    # of the counts, which is the same for every state, so states are ranked
+    # by the total.
+    values = metrics.metric_values(metric, list(table.words))
+    total = sum(value * count for value, count in zip(values, counts))
+
+    # Each state of the beam is a tuple of (total, table, metric values of
+    # the words, applied rules, lexicon hash), ordered from best to worst.
+    beam = [(total, table, values, [], lexicon_hash(table.words))]
+    seen = set()
+
+    for _ in range(generations):
+        if exhausted():
+            break
+
+        expansions = []
+        truncated = False
+
+        for rank, (total, table, values, applied, content) in enumerate(beam):
+            if exhausted():
+                truncated = True
+                break
+
+            keys = []
+
+            # The entries of a rule hold the metric value of each word it
+            # changes, so the new total is found without applying it.
+            for rule in table.applicable_rules():
+                entries = table.entries[rule]
+                new_total = total + sum((entries[index][1] - values[index]) *
+                                        counts[index] for index in entries)
+                keys.append((sign * new_total, -table.positions[rule], rule))
+
+            # Ties are broken in favour of the earlier state, then the later
+            # rule, as in best_rule.
+            for signed_total, position, rule in heapq.nsmallest(
+                    candidates, keys, key=lambda key: key[:2]):
+                expansions.append(((signed_total, rank, position), rule))
+
+        expansions.sort(key=lambda expansion: expansion[0])
+        new_beam = []
+
+        for key, rule in expansions:
+            if len(new_beam) == width:
+                break
+
+            if exhausted():
+                truncated = True
+                break
+
+            total, table, values, applied, content = beam[key[1]]
+            changes = table.changes(rule)
+
+            for index, word in changes.items():
+                content ^= hash((index, table.words[index]))
+                content ^= hash((index, word))
+
+            # The remaining rules of a state depend on which rules were
+            # applied, but not on their order.
+            state = (content, frozenset(table.positions[applied_rule]
+                                        for applied_rule in applied + [rule]))
+
+            if state in seen:
+                continue
+
+            seen.add(state)
+
+            new_values = list(values)
+
+            for index in changes:
+                new_values[index] = table.entries[rule][index][1]
+
+            new_table = table.copy()
+            new_table.apply(rule, changes)
+
+            # A state whose table was left out of date isn't kept
+            if exhausted():
+                truncated = True
+                break
+
+            new_beam.append((sign * key[0], new_table, new_values,
+                             applied + [rule], content))
+
+        # If the budget ran out during the generation, the states of the
+        # previous generation are kept.
+        if not new_beam or truncated:
+            break
+
+        beam = new_beam
+
+    table, applied = beam[0][1], beam[0][3]
 
-    # Return the best rule and the words with the best rule applied
-    return best_rule, [word.apply_rule(best_rule) for word in words]
+    return table.words, applied
@@ -0,0 +1,202 @@
+from array import array
+
+from word import Word
+
+# The fraction of the words of a Lexicon which can be held in its overlay
+# before they are merged into the arrays.
+overlay_fraction = 0.25
+
+
+def collapse(items):
+    '''Collapse duplicates in a list of hashable items, such as word strings or
+    Words. Returns a tuple of three lists: the unique items in order of first
+    appearance, the number of times each unique item appears, and for each of
+    the original items, the index of its unique item.'''
+    unique = []
+    counts = []
+    order = []
+    indices = {}
+
+    for item in items:
+        index = indices.get(item)
+
+        if index is None:
+            index = len(unique)
+            indices[item] = index
+            unique.append(item)
+            counts.append(0)
+
+        counts[index] += 1
+        order.append(index)
+
+    return unique, counts, order
+
+
+def expand(unique, order):
+    '''Reverse collapse, given a list of values for each unique item and the
+    order returned by collapse.'''
+    return [unique[index] for index in order]
+
+
+class Lexicon:
+    '''A compact container of Words. Every word is stored in one flat array of
+    segment codes, with a second array holding the offset at which each word
+    starts, so a word costs a few bytes per segment rather than a list of
+    Segment objects. Each distinct segment is stored once in the segment
+    table, and its code is its index there.
+
+    Words are returned as Word views created on access. Words assigned to a
+    Lexicon are held in an overlay, which is merged into the arrays once it
+    holds more than overlay_fraction of the words.
+
+    '''
+
+    __slots__ = ['segments', 'segment_codes', 'codes', 'offsets', 'overlay',
+                 'shared']
+
+    def __init__(self, words=()):
+        self.segments = []
+        self.segment_codes = {}
+        self.codes = array('I')
+        self.offsets = array('I', [0])
+        self.overlay = {}
+
+        # True if the arrays are shared with a copy of the Lexicon
+        self.shared = False
+
+        for word in words:
+            self.append(word)
+
+    def append(self, word):
+        '''Add a Word to the end of the Lexicon.'''
+        # Arrays shared with a copy are copied before they are changed
+        if self.shared:
+            self.segments = list(self.segments)
+            self.segment_codes = dict(self.segment_codes)
+            self.codes = array('I', self.codes)
+            self.offsets = array('I', self.offsets)
+            self.shared = False
+
+        self.add_codes(word, self.codes)
+        self.offsets.append(len(self.codes))
+
+    def add_codes(self, word, codes):
+        '''Append the codes of the segments of a Word to an array of codes,
+        adding any new segments to the segment table.'''
+        segment_codes = self.segment_codes
+
+        for segment in word.segments:
+            code = segment_codes.get(segment)
+
+            if code is None:
+                code = len(self.segments)
+                segment_codes[segment] = code
+                self.segments.append(segment)
+
+            codes.append(code)
+
+    def copy(self):
+        '''Return a shallow copy of the Lexicon. The arrays are shared until
+        either Lexicon is appended to, when that Lexicon copies them.'''
+        lexicon = Lexicon.__new__(Lexicon)
+        lexicon.segments = self.segments
+        lexicon.segment_codes = self.segment_codes
+        lexicon.codes = self.codes
+        lexicon.offsets = self.offsets
+        lexicon.overlay = dict(self.overlay)
+        lexicon.shared = True
+        self.shared = True
+
+        return lexicon
+
+    def compact(self):
+        '''Return a new Lexicon with the overlay merged into the arrays.'''
+        lexicon = self.copy()
+        lexicon.merge()
+
+        return lexicon
+
+    def merge(self):
+        '''Merge the words in the overlay into the arrays. New arrays are
+        built, so arrays shared with a copy are left unchanged.'''
+        if self.shared:
+            self.segments = list(self.segments)
+            self.segment_codes = dict(self.segment_codes)
+            self.shared = False
+
+        old_codes = self.codes
+        old_offsets = self.offsets
+        codes = array('I')
+        offsets = array('I', [0])
+        start = 0
+
+        # The codes of each run of unchanged words are copied at once, and
+        # their offsets moved by the change in length of the words before
+        for index in sorted(self.overlay) + [len(self)]:
+            shift = len(codes) - old_offsets[start]
+            codes.extend(old_codes[old_offsets[start]:old_offsets[index]])
+            offsets.extend([offset + shift
+                            for offset in old_offsets[start + 1:index + 1]])
+
+            if index < len(self):
+                self.add_codes(self.overlay[index], codes)
+                offsets.append(len(codes))
+
+            start = index + 1
+
+        self.codes = codes
+        self.offsets = offsets
+        self.overlay = {}
+
+    def join_segments(self, function):
+        '''Apply the function to each distinct segment once, returning a list
+        of the joined results for each word. This is used to deparse the
+        Lexicon.'''
+        strings = [function(segment) for segment in self.segments]
+        codes = self.codes
+        offsets = self.offsets
+        overlay = self.overlay
+
+        return [''.join(map(function, overlay[index].segments))
+                if index in overlay else
+                ''.join([strings[code]
+                         for code in codes[offsets[index]:offsets[index + 1]]])
+                for index in range(len(self))]
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self)
+
+        if index in self.overlay:
+            return self.overlay[index]
+
+        if not 0 <= index < len(self):
+            raise IndexError('Lexicon index out of range')
+
+        segments = self.segments
+
+        return Word([segments[code] for code in
+                     self.codes[self.offsets[index]:self.offsets[index + 1]]])
+
+    def __setitem__(self, index, word):
+        if index < 0:
+            index += len(self)
+
+        if not 0 <= index < len(self):
+            raise IndexError('Lexicon index out of range')
+
+        self.overlay[index] = word
+
+        if len(self.overlay) > len(self) * overlay_fraction:
+            self.merge()
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self[index]
+
+    def __eq__(self, other):
+        return len(self) == len(other) and all(
+            first == second for first, second in zip(self, other))
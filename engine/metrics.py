@@ -1,7 +1,8 @@
-from collections import Counter
-from functools import reduce, lru_cache
+from collections import namedtuple
+from functools import lru_cache
 from random import random
-import operator
+
+from segment import condition_masks, boundary
 
 BILABIAL = (0, {'positive': ['labial'], 'negative': ['syllabic']})
 APICAL = (1, {'positive': ['coronal', 'anterior'], 'negative': ['syllabic']})
@@ -23,13 +24,181 @@ RHOTIC_VOWEL = {'positive': ['syllabic', 'coronal', 'anterior', 'distributed'],
 FRICATIVE_OR_AFFRICATE = {'positive': ['delayedrelease']}
 VOICED = {'positive': ['voice']}
 
+SYLLABIC = {'positive': ['syllabic']}
+NON_SYLLABIC = {'negative': ['syllabic']}
+CONSONANTAL = {'positive': ['consonantal']}
+NON_CONSONANTAL = {'negative': ['consonantal']}
+
+# The weights of each phonetic constant in the weighted phonetic product, in
+# the order of PHONETIC_CONSTANTS.
+PHONETIC_WEIGHTS = [0.1658, 0.3149, 0.01129, 0.04945, 0.04945, 0.18, 0.1431,
+                    0.0709]
+
 
-@lru_cache(maxsize=None)
 def classify_segment(segment):
     '''Given a segment, return all phonetic constants which apply to it, in a
-    list.'''
-    return [constant[0] for constant in PHONETIC_CONSTANTS if
-            segment.meets_conditions(constant[1])]
+    tuple.'''
+    return classify_masks(segment.positive_mask, segment.negative_mask)
+
+
+@lru_cache(maxsize=4096)
+def classify_masks(positive_mask, negative_mask):
+    '''Given the feature masks of a segment, return all phonetic constants
+    which apply to it, in a tuple. The cache is keyed by value, so equal
+    segments share an entry.'''
+    classes = []
+
+    for constant, conditions in PHONETIC_CONSTANTS:
+        positive, negative = condition_masks(conditions)
+
+        if (positive_mask & positive == positive and
+                negative_mask & negative == negative):
+            classes.append(constant)
+
+    return tuple(classes)
+
+
+@lru_cache(maxsize=4096)
+def segment_profile(positive_mask, negative_mask):
+    '''Given the feature masks of a segment, return everything the metrics
+    need to know about it, as a tuple of:
+
+        the phonetic constants which apply to it, as by classify_masks;
+        whether it is syllabic, and whether it is non-syllabic;
+        whether it is consonantal, and whether it is non-consonantal;
+        its contribution to the Word Complexity Measure.
+
+    The metrics then only look up the profile of each segment, rather than
+    testing it against each set of conditions.'''
+    def meets(conditions):
+        positive, negative = condition_masks(conditions)
+
+        return (positive_mask & positive == positive and
+                negative_mask & negative == negative)
+
+    complexity = 0
+
+    if meets(VELAR[1]) or meets(LIQUID) or meets(RHOTIC_VOWEL):
+        complexity = 1
+    elif meets(FRICATIVE_OR_AFFRICATE):
+        complexity = 2 if meets(VOICED) else 1
+
+    return (classify_masks(positive_mask, negative_mask),
+            meets(SYLLABIC), meets(NON_SYLLABIC),
+            meets(CONSONANTAL), meets(NON_CONSONANTAL),
+            complexity)
+
+
+# The profile of the word boundary is built outside the cache, so it is a
+# distinct object from the profile of any segment and the last segment of a
+# word can be recognised by the boundary that follows it.
+boundary_profile = segment_profile.__wrapped__(boundary.positive_mask,
+                                               boundary.negative_mask)
+
+
+def word_profiles(word):
+    '''Return the profile of each segment of the word, with the profile of
+    the word boundary added at each end.'''
+    return ([boundary_profile] +
+            [segment_profile(segment.positive_mask, segment.negative_mask)
+             for segment in word.segments] +
+            [boundary_profile])
+
+
+def class_counts(profiles):
+    '''Count the segments of each phonetic constant in the profiles of a
+    word, returning a list indexed by constant.'''
+    counts = [0] * len(PHONETIC_CONSTANTS)
+
+    for profile in profiles[1:-1]:
+        for constant in profile[0]:
+            counts[constant] += 1
+
+    return counts
+
+
+def count_syllables(profiles):
+    '''Count the syllabic segments which follow or precede a non-syllabic
+    segment or the word boundary, given the profiles of a word.'''
+    return sum(1 for index in range(1, len(profiles) - 1)
+               if profiles[index][1] and (profiles[index - 1][2] or
+                                          profiles[index + 1][2]))
+
+
+def count_clusters(profiles):
+    '''Count the consonantal segments which follow a consonantal segment and
+    precede a non-consonantal segment or the word boundary, given the
+    profiles of a word.'''
+    return sum(1 for index in range(1, len(profiles) - 1)
+               if profiles[index][3] and profiles[index - 1][3] and
+               profiles[index + 1][4])
+
+
+def phonetic_product_values(words):
+    '''Compute the phonetic product of each of the words.'''
+    values = []
+
+    for word in words:
+        value = 1
+
+        # Multiply the counts together, adding one to each count
+        for count in class_counts(word_profiles(word)):
+            value *= count + 1
+
+        values.append(value)
+
+    return values
+
+
+def weighted_phonetic_product_values(words):
+    '''Compute the weighted phonetic product of each of the words.'''
+    values = []
+
+    for word in words:
+        counts = class_counts(word_profiles(word))
+        value = counts[0] * PHONETIC_WEIGHTS[0] + 1
+
+        # The factors are multiplied in order, to give exactly the same
+        # result as the product of the list of factors.
+        for count, weight in zip(counts[1:], PHONETIC_WEIGHTS[1:]):
+            value *= count * weight + 1
+
+        values.append(value)
+
+    return values
+
+
+def number_of_syllables_values(words):
+    '''Compute the number of syllables of each of the words.'''
+    return [count_syllables(word_profiles(word)) for word in words]
+
+
+def number_of_consonant_clusters_values(words):
+    '''Compute the number of consonant clusters of each of the words.'''
+    return [count_clusters(word_profiles(word)) for word in words]
+
+
+def word_complexity_measure_values(words):
+    '''Compute the Word Complexity Measure of each of the words.'''
+    values = []
+
+    for word in words:
+        profiles = word_profiles(word)
+        value = count_clusters(profiles)
+
+        if count_syllables(profiles) > 2:
+            value += 1
+
+        # The last segment is the one before the word boundary
+        if profiles[-2][3]:
+            value += 1
+
+        for profile in profiles[1:-1]:
+            value += profile[5]
+
+        values.append(value)
+
+    return values
 
 
 def phonetic_product(word):
@@ -38,18 +207,7 @@ def phonetic_product(word):
     estimators" (1988).
 
     '''
-
-    # Count all applicable features in the word.
-    features = []
-    for segment in word.segments:
-        features.extend(classify_segment(segment))
-
-    feature_count = Counter(features)
-
-    # Multiply the counts together, adding one to each count. The initial value
-    # is one in case of words with no special features.
-    return reduce(operator.mul, map(lambda x: x + 1, feature_count.values()),
-                  1)
+    return phonetic_product_values([word])[0]
 
 
 def weighted_phonetic_product(word):
@@ -60,87 +218,207 @@ def weighted_phonetic_product(word):
     and Tables" (1974).
 
     '''
+    return weighted_phonetic_product_values([word])[0]
+
+
+def number_of_syllables(word):
+    '''Given a word, compute the number of syllables it contains.'''
+    return number_of_syllables_values([word])[0]
+
+
+def number_of_consonant_clusters(word):
+    '''Given a word, compute the number of consonant clusters it contains.'''
+    return number_of_consonant_clusters_values([word])[0]
+
+
+def word_complexity_measure(word):
+    '''Given a word, compute the Word Complexity Measure outlined by Carol
+    Stoel-Gammon in "The Word Complexity Measure: Description and application
+    to developmental phonology and disorders" (2010).
+
+    '''
+    return word_complexity_measure_values([word])[0]
 
-    # Count all applicable features in the word.
-    features = []
-    for segment in word.segments:
-        features.extend(classify_segment(segment))
 
-    feature_count = Counter(features)
+def random_value(word):
+    '''Given a word, return a random value.'''
+    return random()
 
-    segment_types = [feature_count[0] * 0.1658 + 1,
-                     feature_count[1] * 0.3149 + 1,
-                     feature_count[2] * 0.01129 + 1,
-                     feature_count[3] * 0.04945 + 1,
-                     feature_count[4] * 0.04945 + 1,
-                     feature_count[5] * 0.18 + 1,
-                     feature_count[6] * 0.1431 + 1,
-                     feature_count[7] * 0.0709 + 1]
 
-    return reduce(operator.mul, segment_types)
+# The batch version of each metric, which computes it for a whole list of
+# words in one call.
+batch_metrics = {
+    phonetic_product: phonetic_product_values,
+    weighted_phonetic_product: weighted_phonetic_product_values,
+    number_of_syllables: number_of_syllables_values,
+    number_of_consonant_clusters: number_of_consonant_clusters_values,
+    word_complexity_measure: word_complexity_measure_values}
 
 
-def number_of_syllables(word):
-    '''Given a word, compute the number of syllables it contains.'''
-    CV_syllable_rule = {'before': {'negative': ['syllabic']},
-                        'conditions': {'positive': ['syllabic']}}
+def metric_values(metric, words):
+    '''Return the value of the metric for each of the words, using its batch
+    version if it has one.'''
+    batch = batch_metrics.get(metric)
 
-    VC_syllable_rule = {'after': {'negative': ['syllabic']},
-                        'conditions': {'positive': ['syllabic']}}
+    if batch is None:
+        return [metric(word) for word in words]
 
-    syllables = 0
+    return batch(words)
 
-    for index in range(len(word.segments)):
-        is_CV_syllable = word.index_applicable(index, CV_syllable_rule)
-        is_VC_syllable = word.index_applicable(index, VC_syllable_rule)
 
-        if is_VC_syllable or is_CV_syllable:
-            syllables += 1
+# A metric is decomposable if its value can be computed from sums of terms for
+# each segment of a word, where the terms of a segment only depend on the
+# profiles of the segment and of the segments up to radius positions either
+# side. The add_terms function takes the padded profiles of a word, an index
+# into them, a list of size sums and a sign, and adds the terms of that
+# segment multiplied by the sign to the sums. The value function takes the
+# sums over a whole word and returns the value of the metric.
+Decomposition = namedtuple('Decomposition',
+                           ['radius', 'size', 'add_terms', 'value'])
 
-    return syllables
 
+def add_class_terms(profiles, index, sums, sign):
+    '''Count the phonetic constants of a segment.'''
+    for constant in profiles[index][0]:
+        sums[constant] += sign
 
-def number_of_consonant_clusters(word):
-    '''Given a word, compute the number of consonant clusters it contains.'''
-    cluster_rule = {'before': {'positive': ['consonantal']},
-                    'conditions': {'positive': ['consonantal']},
-                    'after': {'negative': ['consonantal']}}
 
-    return len([index for index in range(len(word.segments))
-                if word.index_applicable(index, cluster_rule)])
+def add_syllable_terms(profiles, index, sums, sign):
+    '''Count the segment if it is counted as a syllable by
+    count_syllables.'''
+    if profiles[index][1] and (profiles[index - 1][2] or
+                               profiles[index + 1][2]):
+        sums[0] += sign
 
 
-def word_complexity_measure(word):
-    '''Given a word, compute the Word Complexity Measure outlined by Carol
-    Stoel-Gammon in "The Word Complexity Measure: Description and application
-    to developmental phonology and disorders" (2010).
+def add_cluster_terms(profiles, index, sums, sign):
+    '''Count the segment if it is counted as a cluster by count_clusters.'''
+    profile = profiles[index]
 
-    '''
-    WCM_score = 0
+    if profile[3] and profiles[index - 1][3] and profiles[index + 1][4]:
+        sums[0] += sign
 
-    if number_of_syllables(word) > 2:
-        WCM_score += 1
 
-    if 'consonantal' in word.segments[-1].positive:
-        WCM_score += 1
+def add_complexity_terms(profiles, index, sums, sign):
+    '''Count the parts of the Word Complexity Measure of a segment: whether it
+    is a syllable and a cluster, its own contribution, and whether it is a
+    final consonant.'''
+    profile = profiles[index]
+    before = profiles[index - 1]
+    after = profiles[index + 1]
 
-    WCM_score += number_of_consonant_clusters(word)
+    if profile[1] and (before[2] or after[2]):
+        sums[0] += sign
 
-    for segment in word.segments:
-        if segment.meets_conditions(VELAR[1]):
-            WCM_score += 1
-        elif segment.meets_conditions(LIQUID):
-            WCM_score += 1
-        elif segment.meets_conditions(RHOTIC_VOWEL):
-            WCM_score += 1
-        elif segment.meets_conditions(FRICATIVE_OR_AFFRICATE):
-            WCM_score += 1
-            if segment.meets_conditions(VOICED):
-                WCM_score += 1
+    if profile[3] and before[3] and after[4]:
+        sums[1] += sign
 
-    return WCM_score
+    sums[2] += sign * profile[5]
 
+    if profile[3] and after is boundary_profile:
+        sums[3] += sign
 
-def random_value(word):
-    '''Given a word, return a random value.'''
-    return random()
+
+def product_value(counts):
+    '''The phonetic product of the counts of each phonetic constant.'''
+    value = 1
+
+    for count in counts:
+        value *= count + 1
+
+    return value
+
+
+def weighted_product_value(counts):
+    '''The weighted phonetic product of the counts of each phonetic
+    constant.'''
+    value = counts[0] * PHONETIC_WEIGHTS[0] + 1
+
+    for count, weight in zip(counts[1:], PHONETIC_WEIGHTS[1:]):
+        value *= count * weight + 1
+
+    return value
+
+
+def complexity_value(sums):
+    '''The Word Complexity Measure of the sums of add_complexity_terms.'''
+    syllables, clusters, complexity, final = sums
+
+    return clusters + complexity + final + (1 if syllables > 2 else 0)
+
+
+def first_value(sums):
+    '''The value of a metric with a single sum.'''
+    return sums[0]
+
+
+decomposable_metrics = {
+    phonetic_product: Decomposition(0, len(PHONETIC_CONSTANTS),
+                                    add_class_terms, product_value),
+    weighted_phonetic_product: Decomposition(0, len(PHONETIC_CONSTANTS),
+                                             add_class_terms,
+                                             weighted_product_value),
+    number_of_syllables: Decomposition(1, 1, add_syllable_terms,
+                                       first_value),
+    number_of_consonant_clusters: Decomposition(1, 1, add_cluster_terms,
+                                                first_value),
+    word_complexity_measure: Decomposition(1, 4, add_complexity_terms,
+                                           complexity_value)}
+
+
+def metric_state(metric, word):
+    '''Return the state of a decomposable metric for a word, which is a tuple
+    of the padded profiles of the word and the sums of its terms.'''
+    decomposition = decomposable_metrics[metric]
+    profiles = word_profiles(word)
+    sums = [0] * decomposition.size
+
+    for index in range(1, len(profiles) - 1):
+        decomposition.add_terms(profiles, index, sums, 1)
+
+    return profiles, sums
+
+
+def changed_value(metric, state, sites, masks):
+    '''Return the value of a decomposable metric for a word after replacing
+    its segments at the given sites with segments with the given masks, as a
+    list of tuples of (positive mask, negative mask), using the state of the
+    word before the change. Only the terms of the segments within the radius
+    of the metric of a site are recomputed.'''
+    decomposition = decomposable_metrics[metric]
+    add_terms = decomposition.add_terms
+    radius = decomposition.radius
+    profiles, sums = state
+    sums = list(sums)
+
+    if radius == 0:
+        for site, (positive_mask, negative_mask) in zip(sites, masks):
+            add_terms(profiles, site + 1, sums, -1)
+            add_terms([segment_profile(positive_mask, negative_mask)], 0,
+                      sums, 1)
+
+        return decomposition.value(sums)
+
+    # The padded index of every segment whose terms may change
+    last = len(profiles) - 2
+    affected = sorted({index
+                       for site in sites
+                       for index in range(max(site + 1 - radius, 1),
+                                          min(site + 1 + radius, last) + 1)})
+
+    # The new terms are computed on a copy of the window around the changed
+    # segments, rather than on a copy of the whole word.
+    start = affected[0] - radius
+    window = profiles[start:affected[-1] + radius + 1]
+
+    for index in affected:
+        add_terms(profiles, index, sums, -1)
+
+    for site, (positive_mask, negative_mask) in zip(sites, masks):
+        window[site + 1 - start] = segment_profile(positive_mask,
+                                                   negative_mask)
+
+    for index in affected:
+        add_terms(window, index - start, sums, 1)
+
+    return decomposition.value(sums)
@@ -0,0 +1,171 @@
+import os
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+from evolve import RuleTable, find_applicable_rules, score_sites
+from lexicon import Lexicon
+from rule import compile_rule
+import segment
+import vectorised
+
+# Workers are started by a fork server, or as new processes, rather than
+# forked from the engine. The engine may be serving requests in other
+# threads, and a child forked while one of them holds a lock, such as
+# segment.feature_lock, could wait for it forever.
+if 'forkserver' in multiprocessing.get_all_start_methods():
+    start_context = multiprocessing.get_context('forkserver')
+else:
+    start_context = multiprocessing.get_context('spawn')
+
+# The state of a worker process. The words, rules and metric are sent once,
+# when the worker starts. Each task carries the history of applied rules, as
+# pairs of (rule position, changed word indices), which the worker replays to
+# bring its copy of the words up to date.
+worker_words = None
+worker_rules = None
+worker_metric = None
+worker_history = []
+worker_states = {}
+
+
+def initialise_worker(words, rules, metric, feature_names):
+    '''Store the lexicon, rules and metric in a new worker process. Features
+    given bits by the engine are given the same bits in the worker, in the
+    same order.'''
+    global worker_words, worker_rules, worker_metric, worker_history
+    global worker_states
+
+    for feature in feature_names[len(segment.feature_names):]:
+        segment.feature_mask([feature])
+
+    worker_words = words
+    worker_rules = rules
+    worker_metric = metric
+    worker_history = []
+    worker_states = {}
+
+
+def synchronise(history):
+    '''Apply the rules in the history which the worker hasn't seen yet. Only
+    the words which changed in the main process are modified.'''
+    for position, changed in history[len(worker_history):]:
+        rule = worker_rules[position]
+
+        for index in changed:
+            worker_words[index] = worker_words[index].apply_rule(rule)
+            worker_states.pop(index, None)
+
+        worker_history.append((position, changed))
+
+
+def compute_entries(history, positions, indices):
+    '''Compute the RuleTable entries of the rules at the given positions, for
+    the words at the given indices, or all words if indices is None. Returns a
+    list of entry dictionaries, one for each position.'''
+    synchronise(history)
+
+    if indices is None:
+        indices = range(len(worker_words))
+
+    words = [worker_words[index] for index in indices]
+    rules = [worker_rules[position] for position in positions]
+    results = {rule: {} for rule in rules}
+
+    for rule, sites in find_applicable_rules(words, rules):
+        results[rule] = score_sites(worker_words, rule,
+                                    {indices[row]: word_sites
+                                     for row, word_sites in sites.items()},
+                                    worker_metric, worker_states)
+
+    return [results[rule] for rule in rules]
+
+
+class ParallelRuleTable(RuleTable):
+    '''A RuleTable which computes the entries of its rules across a pool of
+    worker processes. The lexicon is sent to each worker once, and the rules
+    are divided between the workers for each generation. The entries are
+    identical to those of a RuleTable, so the same rules are selected.
+
+    The metric must be picklable, such as a function defined at the top level
+    of a module. Workers aren't forked from the engine, so a script which uses
+    the table must guard its entry point with if __name__ == '__main__'.
+
+    '''
+
+    def __init__(self, words, rules, metric, counts=None, workers=None,
+                 budget=None):
+        self.workers = workers or os.cpu_count() or 1
+        self.history = []
+        rules = [compile_rule(rule) for rule in rules]
+
+        # A Lexicon is sent in its compact form
+        if isinstance(words, Lexicon):
+            worker_copy = words.compact()
+        else:
+            worker_copy = list(words)
+
+        self.executor = ProcessPoolExecutor(
+            self.workers, mp_context=start_context,
+            initializer=initialise_worker,
+            initargs=(worker_copy, rules, metric,
+                      list(segment.feature_names)))
+
+        super().__init__(words, rules, metric, counts, budget)
+
+    def compute(self, rules, indices):
+        '''Compute the entries of the given rules for the words at the given
+        indices across the pool, returning a list of entry dictionaries. The
+        list is cut short if the budget runs out.'''
+        if not rules:
+            return []
+
+        positions = [self.positions[rule] for rule in rules]
+        size = -(-len(positions) // self.workers)
+
+        # With a budget, the rules are divided into smaller chunks, so that
+        # the budget is checked more often at some cost in overhead.
+        if self.budget is not None:
+            size = min(size, vectorised.rule_group_size)
+        chunks = [positions[start:start + size]
+                  for start in range(0, len(positions), size)]
+
+        futures = [self.executor.submit(compute_entries, self.history, chunk,
+                                        indices)
+                   for chunk in chunks]
+
+        results = []
+
+        # Each chunk is recorded in the budget as its entries are collected.
+        # If the budget runs out, the chunks which haven't started are
+        # cancelled, and the entries of the rules computed so far are
+        # returned.
+        for chunk, future in zip(chunks, futures):
+            if self.exhausted():
+                for remaining in futures:
+                    remaining.cancel()
+
+                break
+
+            results.extend(future.result())
+
+            if self.budget is not None:
+                self.budget.spend(len(chunk))
+
+        return results
+
+    def populate(self):
+        for rule, entries in zip(self.rules, self.compute(self.rules, None)):
+            self.replace(rule, list(entries), entries)
+
+    def update(self, rule, changed):
+        self.history.append((self.positions[rule], changed))
+
+        if not changed or not self.rules:
+            return
+
+        for remaining_rule, entries in zip(self.rules,
+                                           self.compute(self.rules, changed)):
+            self.replace(remaining_rule, changed, entries)
+
+    def close(self):
+        self.executor.shutdown()
@@ -1,31 +1,94 @@
-from segment import Segment
+from segment import Segment, MaskSegment
 from word import Word
-
-
-def parse_words(strings, segments, diacritics):
+from cache import LRUCache
+
+
+class ParseContext:
+    '''The data used to parse words, built once from the list of segment
+    dictionaries and the list of diacritic rules. It holds a trie of segment
+    strings, the base Segment of each IPA string, the Segment of each
+    diacritic, and bounded memos of parsed tokens and words, which are kept
+    between calls so repeated words are never parsed twice.'''
+
+    def __init__(self, segments, diacritics, token_cache_size=4096,
+                 word_cache_size=65536):
+        self.segment_strings = build_trie(segment['IPA']
+                                          for segment in segments)
+        self.diacritic_strings = {diacritic['IPA'] for diacritic in diacritics}
+
+        self.base_segments = {segment['IPA']:
+                              MaskSegment.from_dictionary(segment)
+                              for segment in segments}
+
+        # Diacritics keep their order in the list, which is the order they
+        # are added to a segment.
+        self.diacritic_segments = [
+            (diacritic['IPA'],
+             MaskSegment.from_features(
+                 diacritic['applies'].get('positive', []),
+                 diacritic['applies'].get('negative', [])))
+            for diacritic in diacritics]
+
+        self.tokens = LRUCache(token_cache_size)
+        self.words = LRUCache(word_cache_size)
+
+    def token_to_segment(self, token):
+        '''Convert a string token in IPA to a Segment, in the same way as
+        token_to_segment.'''
+        segment = self.tokens.get(token)
+
+        if segment is None:
+            # Isolate the base IPA segment string
+            base_string = ''.join(character for character in token
+                                  if character not in self.diacritic_strings)
+            segment = self.base_segments[base_string]
+
+            # Add each diacritic present to the segment
+            for string, diacritic_segment in self.diacritic_segments:
+                if string in token:
+                    segment = segment + diacritic_segment
+
+            self.tokens[token] = segment
+
+        return segment
+
+    def parse_word(self, word):
+        '''Parse a word string (in IPA) into a Word.'''
+        parsed_word = self.words.get(word)
+
+        if parsed_word is None:
+            try:
+                tokens = tokenise(word, self.segment_strings,
+                                  self.diacritic_strings)
+            except ValueError as subword:
+                error = ('Error parsing word: {0}. There was an unknown '
+                         'character in the subword: {1}')
+                raise ValueError(error.format(word, subword))
+
+            parsed_word = Word([self.token_to_segment(token)
+                                for token in tokens])
+            self.words[word] = parsed_word
+
+        return parsed_word
+
+
+def parse_words(strings, segments, diacritics, words=None, context=None):
     '''Given a list of word strings (in IPA), return a list of Word objects
     containing parsed segments. Use the given list of segment dictionaries and
-    diacritic rules.
+    diacritic rules. If words is given, the parsed Words are appended to it
+    and it is returned instead; this allows a Lexicon to be filled directly.
+    If context is given, it is a ParseContext built from the same segments and
+    diacritics, which is reused rather than built for this call.
 
     '''
+    if context is None:
+        context = ParseContext(segments, diacritics)
 
-    # Create two lists of available segments and diacritics
-    segment_strings = [segment['IPA'] for segment in segments]
-    diacritic_strings = [diacritic['IPA'] for diacritic in diacritics]
-
-    words = []
+    if words is None:
+        words = []
 
     for word in strings:
-        try:
-            tokens = tokenise(word, segment_strings, diacritic_strings)
-        except ValueError as subword:
-            error = ('Error parsing word: {0}. There was an unknown character '
-                     'in the subword: {1}')
-            raise ValueError(error.format(word, subword))
-
-        parsed_segments = [token_to_segment(token, segments, diacritics) for
-                           token in tokens]
-        words.append(Word(parsed_segments))
+        words.append(context.parse_word(word))
 
     return words
 
@@ -48,28 +111,65 @@ def valid_subword(subword, segment_strings, diacritic_strings):
         return False
 
 
+def build_trie(segment_strings):
+    '''Build a trie of IPA segment strings, as nested dictionaries keyed by
+    character. The None key marks the end of a segment string.'''
+    trie = {}
+
+    for string in segment_strings:
+        node = trie
+
+        for character in string:
+            node = node.setdefault(character, {})
+
+        node[None] = True
+
+    return trie
+
+
 def tokenise(word, segment_strings, diacritic_strings):
-    '''Recursively tokenise a string of IPA characters, with support for diacritics
-    and digraphs. Example: bok͡piʰ becomes ["b", "o", "k͡p", "iʰ"].
+    '''Tokenise a string of IPA characters, with support for diacritics and
+    digraphs. Example: bok͡piʰ becomes ["b", "o", "k͡p", "iʰ"]. The segment
+    strings may be given as a trie built by build_trie.
+
+    Each token is the longest valid subword at the current position: a segment
+    string followed by any number of diacritics.
 
     '''
+    if not isinstance(segment_strings, dict):
+        segment_strings = build_trie(segment_strings)
+
+    tokens = []
+    start = 0
+
+    while start < len(word):
+        token_end = None
+
+        # Walk the trie along the word. Wherever a segment string ends, extend
+        # the token over any diacritics that follow it.
+        node = segment_strings
+        index = start
+
+        while index < len(word) and word[index] in node:
+            node = node[word[index]]
+            index += 1
+
+            if None in node:
+                end = index
+
+                while end < len(word) and word[end] in diacritic_strings:
+                    end += 1
 
-    # The end condition for the recursion: an empty string.
-    if len(word) == 0:
-        return []
+                if token_end is None or end > token_end:
+                    token_end = end
 
-    # Iterate through substrings of the word, removing one letter at a time
-    # from the end
-    for length in range(len(word), -1, -1):
-        subword = word[:length]
+        if token_end is None:
+            raise ValueError(word[start:])
 
-        # If the current substring is a valid sequence in IPA, add it to the
-        # results list and recur
-        if valid_subword(subword, segment_strings, diacritic_strings):
-            return [subword] + tokenise(word[length:], segment_strings,
-                                        diacritic_strings)
+        tokens.append(word[start:token_end])
+        start = token_end
 
-    raise ValueError(word)
+    return tokens
 
 
 def find_segment(string, segment_strings):
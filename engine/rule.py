@@ -0,0 +1,140 @@
+import copy
+
+from segment import MaskSegment, feature_mask
+
+
+class CompiledRule:
+    '''A rule dictionary compiled into the masks used when matching and
+    applying it, so that the dictionary doesn't need to be searched every
+    time the rule is tested against a segment. The original dictionary is
+    kept as the rule attribute, for conversion back into JSON. If
+    new_features is False, the rule may only use features which already have
+    a bit, as described in segment.feature_mask.'''
+
+    __slots__ = ['rule', 'name', 'conditions', 'before', 'after', 'first',
+                 'last', 'applies', 'deletion', '_reversed']
+
+    def __init__(self, rule, new_features=True):
+        self.rule = rule
+        self.name = rule.get('name')
+
+        # Conditions are stored as a tuple of (positive mask, negative mask).
+        # Before and after conditions are None if they aren't present.
+        self.conditions = compile_conditions(rule.get('conditions', {}),
+                                             new_features)
+        self.before = (compile_conditions(rule['before'], new_features)
+                       if 'before' in rule else None)
+        self.after = (compile_conditions(rule['after'], new_features)
+                      if 'after' in rule else None)
+
+        # Like the uncompiled rule, the presence of the first or last key is
+        # what anchors it to the word boundary.
+        self.first = 'first' in rule
+        self.last = 'last' in rule
+
+        applies = rule.get('applies', {})
+        self.deletion = 'deletion' in applies.get('positive', [])
+        self.applies = MaskSegment(
+            feature_mask(applies.get('positive', []), new_features),
+            feature_mask(applies.get('negative', []), new_features))
+
+        self._reversed = None
+
+    @property
+    def reversed(self):
+        '''The compiled equivalent of the rule applied in reverse. It is
+        computed once, the first time it is needed.'''
+        if self._reversed is None:
+            self._reversed = CompiledRule(reverse_rule(self.rule))
+
+        return self._reversed
+
+    def __repr__(self):
+        return '<CompiledRule> {0}'.format(self.name)
+
+
+def compile_conditions(conditions, new_features=True):
+    '''Convert a dictionary of conditions into a tuple of (positive mask,
+    negative mask).'''
+    return (feature_mask(conditions.get('positive', []), new_features),
+            feature_mask(conditions.get('negative', []), new_features))
+
+
+# Compiled rules for rule dictionaries passed directly to Word methods, keyed
+# by the identity of the dictionary in the same way as
+# segment.condition_cache.
+compiled_cache = {}
+compiled_cache_size = 1024
+
+
+def compile_rule(rule):
+    '''Return the CompiledRule for the given rule, which may be a rule
+    dictionary or already compiled.'''
+    if isinstance(rule, CompiledRule):
+        return rule
+
+    entry = compiled_cache.get(id(rule))
+
+    if entry is None or entry[0] is not rule:
+        if len(compiled_cache) >= compiled_cache_size:
+            compiled_cache.clear()
+
+        entry = (rule, CompiledRule(rule))
+        compiled_cache[id(rule)] = entry
+
+    return entry[1]
+
+
+def compile_rules(rules, new_features=True):
+    '''Compile a list of rule dictionaries.'''
+    return [CompiledRule(rule, new_features) for rule in rules]
+
+
+def reverse_rule(rule):
+    '''Given a rule dictionary, transform it so that it applies the rule in
+    reverse.'''
+    reversed_rule = {'name': rule['name'], 'description': rule['description']}
+
+    # Before and after conditions are unchanged
+    if 'before' in rule:
+        reversed_rule['before'] = rule['before']
+    if 'after' in rule:
+        reversed_rule['after'] = rule['after']
+
+    # Invert application
+    new_applies = {}
+    if 'positive' in rule['applies']:
+        new_applies['negative'] = list(set(rule['applies']['positive']))
+
+    if 'negative' in rule['applies']:
+        new_applies['positive'] = list(set(rule['applies']['negative']))
+
+    # The new conditions are the same as the old application features.
+    # We must use a deep copy to prevent in-place modification.
+    new_conditions = copy.deepcopy(rule['applies'])
+
+    # Construct set containing all features present in the new conditions.
+    new_conditions_set = set(
+        new_conditions.get('positive', []) + new_conditions.get('negative',
+                                                                []))
+
+    # For each feature in the old conditions, if it isn't in the new conditions
+    # add it, keeping the same polarity. This catches conditions that aren't
+    # changed by the rule.
+    for feature in rule['conditions'].get('positive', []):
+        if feature not in new_conditions_set:
+            if 'positive' in new_conditions:
+                new_conditions['positive'].append(feature)
+            else:
+                new_conditions['positive'] = [feature]
+    for feature in rule['conditions'].get('negative', []):
+        if feature not in new_conditions_set:
+            if 'negative' in new_conditions:
+                new_conditions['negative'].append(feature)
+            else:
+                new_conditions['negative'] = [feature]
+
+    reversed_rule['conditions'] = new_conditions
+    reversed_rule['applies'] = new_applies
+
+    return reversed_rule
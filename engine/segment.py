@@ -1,4 +1,88 @@
-from deparse import feature_order
+from threading import Lock
+from weakref import WeakValueDictionary
+
+from deparse import feature_order, mask_feature_string
+
+# Each feature is represented by a single bit, indexed by its position in
+# deparse.feature_order, followed by the 'deletion' pseudo-feature used by
+# rules. Other features, such as those used by the rules in the engine data,
+# are assigned a new bit when first seen. Rules sent with a request are
+# compiled without assigning new bits, so the tables can't grow without
+# bound in a long running process.
+feature_names = list(feature_order) + ['deletion']
+feature_bits = {feature: 1 << index
+                for index, feature in enumerate(feature_names)}
+
+# Held while a new feature is assigned a bit, so that two threads can't give
+# the same feature different bits.
+feature_lock = Lock()
+
+
+def feature_mask(features, new_features=True):
+    '''Convert an iterable of feature names into an integer bitmask. If
+    new_features is False, a ValueError is raised for a feature which hasn't
+    been assigned a bit, rather than assigning it one.'''
+    mask = 0
+
+    for feature in features:
+        bit = feature_bits.get(feature)
+
+        if bit is None:
+            if not new_features:
+                raise ValueError('Unknown feature: {0}'.format(feature))
+
+            with feature_lock:
+                bit = feature_bits.get(feature)
+
+                if bit is None:
+                    bit = 1 << len(feature_names)
+                    feature_bits[feature] = bit
+                    feature_names.append(feature)
+
+        mask |= bit
+
+    return mask
+
+
+def add_masks(positive_mask, negative_mask, other):
+    '''Return the tuple of (positive mask, negative mask) of the segment with
+    the given masks after adding the segment other, without creating the new
+    segment.'''
+    return ((positive_mask | other.positive_mask) & ~other.negative_mask,
+            (negative_mask & ~other.positive_mask) | other.negative_mask)
+
+
+# Masks of condition dictionaries, keyed by the identity of the dictionary.
+# The dictionary itself is stored alongside its masks so that the identity
+# cannot be reused while the entry exists.
+condition_cache = {}
+condition_cache_size = 4096
+
+
+def condition_masks(conditions):
+    '''Convert a dictionary of conditions in the format used by
+    Segment.meets_conditions into a tuple of (positive mask, negative mask).
+    Results are cached by identity, so a conditions dictionary must not be
+    modified after it has been matched against.'''
+    entry = condition_cache.get(id(conditions))
+
+    if entry is None or entry[0] is not conditions:
+        if len(condition_cache) >= condition_cache_size:
+            condition_cache.clear()
+
+        entry = (conditions,
+                 feature_mask(conditions.get('positive', [])),
+                 feature_mask(conditions.get('negative', [])))
+        condition_cache[id(conditions)] = entry
+
+    return entry[1], entry[2]
+
+
+def mask_features(mask):
+    '''Convert an integer bitmask into a list of feature names, in bit
+    order.'''
+    return [feature for index, feature in enumerate(feature_names)
+            if mask >> index & 1]
 
 
 class Segment:
@@ -37,10 +121,22 @@ class Segment:
 
             self._positive.append(feature)
 
+    @property
+    def positive_mask(self):
+        return feature_mask(self._positive)
+
     @property
     def negative(self):
         return self._negative
 
+    @property
+    def negative_mask(self):
+        return feature_mask(self._negative)
+
+    @property
+    def feature_string(self):
+        return mask_feature_string(self.positive_mask, self.negative_mask)
+
     def add_negative(self, feature):
         '''Add the feature to the negative list. If it already exists in the
         positive list, remove it from positive.'''
@@ -96,6 +192,110 @@ class Segment:
                                                                self._negative)
 
 
+class MaskSegment:
+    '''A phonetic segment stored as two integer bitmasks, one for positive and
+    one for negative features. It behaves like a Segment, but matching
+    conditions and adding segments are performed with mask arithmetic rather
+    than list scans.
+
+    MaskSegments are immutable and interned: creating a segment with the same
+    masks as a living segment returns that segment, so identical feature
+    bundles share one object with a precomputed hash and feature string.
+
+    '''
+
+    __slots__ = ['positive_mask', 'negative_mask', 'feature_string', '_hash',
+                 '__weakref__']
+
+    # The pool only holds weak references, so segments which are no longer
+    # used by any word are discarded.
+    _pool = WeakValueDictionary()
+
+    def __new__(cls, positive_mask, negative_mask):
+        key = (positive_mask, negative_mask)
+        segment = cls._pool.get(key)
+
+        if segment is None:
+            segment = object.__new__(cls)
+            object.__setattr__(segment, 'positive_mask', positive_mask)
+            object.__setattr__(segment, 'negative_mask', negative_mask)
+            object.__setattr__(segment, 'feature_string',
+                               mask_feature_string(positive_mask,
+                                                   negative_mask))
+            object.__setattr__(segment, '_hash', hash(key))
+            segment = cls._pool.setdefault(key, segment)
+
+        return segment
+
+    def __setattr__(self, name, value):
+        raise AttributeError('MaskSegment objects are immutable')
+
+    def __reduce__(self):
+        return MaskSegment, (self.positive_mask, self.negative_mask)
+
+    @classmethod
+    def from_features(cls, positive, negative):
+        '''Initialise the segment from lists of positive and negative feature
+        names.'''
+        return cls(feature_mask(positive), feature_mask(negative))
+
+    @classmethod
+    def from_dictionary(cls, feature_dictionary):
+        '''Initialise the segment from a dictionary of features, in the same
+        format as Segment.from_dictionary.'''
+        return cls.from_segment(Segment.from_dictionary(feature_dictionary))
+
+    @classmethod
+    def from_segment(cls, segment):
+        '''Initialise the segment from any object with positive and negative
+        feature lists.'''
+        return cls.from_features(segment.positive, segment.negative)
+
+    @property
+    def positive(self):
+        return mask_features(self.positive_mask)
+
+    @property
+    def negative(self):
+        return mask_features(self.negative_mask)
+
+    def meets_masks(self, positive_mask, negative_mask):
+        '''Returns True if every bit in positive_mask is set in the positive
+        mask of the segment, and every bit in negative_mask is set in the
+        negative mask.'''
+        return (self.positive_mask & positive_mask == positive_mask and
+                self.negative_mask & negative_mask == negative_mask)
+
+    def meets_conditions(self, conditions):
+        '''Takes a dictionary of features, in the same format as
+        Segment.meets_conditions, and returns True if the segment meets
+        them.'''
+        positive_mask, negative_mask = condition_masks(conditions)
+
+        return (self.positive_mask & positive_mask == positive_mask and
+                self.negative_mask & negative_mask == negative_mask)
+
+    def __add__(self, other):
+        '''Add two segments, with the values of the second overriding those of
+        the first that differ.'''
+        return MaskSegment(*add_masks(self.positive_mask, self.negative_mask,
+                                      other))
+
+    def __eq__(self, other):
+        if not isinstance(other, MaskSegment):
+            return NotImplemented
+
+        return (self.positive_mask == other.positive_mask and
+                self.negative_mask == other.negative_mask)
+
+    def __hash__(self):
+        return self._hash
+
+    def __repr__(self):
+        return '<MaskSegment> Positive: {0}, Negative: {1}'.format(
+            self.positive, self.negative)
+
+
 # A pseudo-segment that has all negative features, representing
 # a word boundary
-boundary = Segment(positive=[], negative=feature_order)
+boundary = MaskSegment.from_features(positive=[], negative=feature_order)
@@ -0,0 +1,399 @@
+# An optional NumPy backend for finding and applying rules across a whole
+# list of words at once. Words are encoded as padded (words × positions)
+# arrays of feature masks, and the conditions, context and anchoring of every
+# rule are evaluated with broadcasted array operations. The methods of Word
+# remain the reference implementation; this backend is only used for lists of
+# at least threshold words, when NumPy is installed.
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from segment import MaskSegment, boundary
+from rule import compile_rule
+from word import Word
+from lexicon import Lexicon
+
+# The minimum number of words for which the vectorised backend is used.
+threshold = 2000
+
+# The maximum number of (rule, word, position) elements evaluated at once,
+# which bounds the memory used by match.
+block_size = 1 << 22
+
+# The number of rules whose sites are found at once when a RuleTable is
+# populated, between which its budget is checked.
+rule_group_size = 8
+
+# The minimum number of unmatched segments for which deparsing is batched.
+deparse_threshold = 256
+
+
+def deparse_enabled(feature_strings, index):
+    '''Returns True if the given unmatched feature strings should be matched
+    in a batch against the FeatureIndex. Bits are counted with
+    numpy.bitwise_count, which needs NumPy 2, and feature strings must fit
+    into an unsigned 64 bit integer.'''
+    return (numpy is not None and hasattr(numpy, 'bitwise_count') and
+            index.width <= 64 and len(feature_strings) >= deparse_threshold)
+
+
+def mask_width(words, rules=()):
+    '''Return the number of bits needed by the feature masks of the segments
+    of the words and the masks of the rules.'''
+    if isinstance(words, Lexicon):
+        segments = words.segments + [segment
+                                     for word in words.overlay.values()
+                                     for segment in word.segments]
+    else:
+        segments = {segment for word in words for segment in word.segments}
+
+    masks = 0
+
+    for segment in segments:
+        masks |= segment.positive_mask | segment.negative_mask
+
+    for rule in rules:
+        rule = compile_rule(rule)
+
+        for mask in [rule.conditions, rule.before or (0, 0),
+                     rule.after or (0, 0)]:
+            masks |= mask[0] | mask[1]
+
+        masks |= rule.applies.positive_mask | rule.applies.negative_mask
+
+    return masks.bit_length()
+
+
+def enabled(words, rules=()):
+    '''Returns True if the vectorised backend should be used for the given
+    words and rules. The feature masks they use must fit into a signed 64 bit
+    integer.'''
+    return (numpy is not None and len(words) >= threshold and
+            mask_width(words, rules) < 64)
+
+
+def encode(words):
+    '''Encode a list or Lexicon of Words as a tuple of (positive masks,
+    negative masks, lengths), where the masks are padded (words × positions)
+    arrays.'''
+    if isinstance(words, Lexicon):
+        return encode_lexicon(words)
+
+    lengths = numpy.fromiter((len(word.segments) for word in words),
+                             dtype=numpy.int64, count=len(words))
+    width = max(int(lengths.max()) if len(words) else 0, 1)
+
+    positive = numpy.zeros((len(words), width), dtype=numpy.int64)
+    negative = numpy.zeros((len(words), width), dtype=numpy.int64)
+
+    for row, word in enumerate(words):
+        for column, segment in enumerate(word.segments):
+            positive[row, column] = segment.positive_mask
+            negative[row, column] = segment.negative_mask
+
+    return positive, negative, lengths
+
+
+def encode_lexicon(words):
+    '''Encode a Lexicon, as encode does, by looking up the codes in its
+    arrays in a table of the masks of its distinct segments. Only the words in
+    its overlay are encoded one segment at a time.'''
+    offsets = numpy.frombuffer(words.offsets, dtype=numpy.uintc).astype(
+        numpy.int64)
+    codes = numpy.frombuffer(words.codes, dtype=numpy.uintc)
+    lengths = numpy.diff(offsets)
+
+    for row, word in words.overlay.items():
+        lengths[row] = len(word.segments)
+
+    width = max(int(lengths.max()) if len(words) else 0, 1)
+    positive = numpy.zeros((len(words), width), dtype=numpy.int64)
+    negative = numpy.zeros((len(words), width), dtype=numpy.int64)
+
+    positive_masks = numpy.array([segment.positive_mask
+                                  for segment in words.segments] or [0],
+                                 dtype=numpy.int64)
+    negative_masks = numpy.array([segment.negative_mask
+                                  for segment in words.segments] or [0],
+                                 dtype=numpy.int64)
+
+    rows = numpy.repeat(numpy.arange(len(words)), numpy.diff(offsets))
+    columns = numpy.arange(len(codes)) - offsets[rows]
+    positive[rows, columns] = positive_masks[codes]
+    negative[rows, columns] = negative_masks[codes]
+
+    for row, word in words.overlay.items():
+        positive[row] = 0
+        negative[row] = 0
+
+        for column, segment in enumerate(word.segments):
+            positive[row, column] = segment.positive_mask
+            negative[row, column] = segment.negative_mask
+
+    return positive, negative, lengths
+
+
+def contexts(encoded):
+    '''Return the masks of the segments before and after each position, using
+    the boundary segment at the edges of each word.'''
+    positive, negative, lengths = encoded
+    last = numpy.arange(positive.shape[1]) == (lengths - 1)[:, None]
+
+    before_positive = numpy.zeros_like(positive)
+    before_negative = numpy.full_like(negative, boundary.negative_mask)
+    before_positive[:, 1:] = positive[:, :-1]
+    before_negative[:, 1:] = negative[:, :-1]
+
+    after_positive = numpy.zeros_like(positive)
+    after_negative = numpy.full_like(negative, boundary.negative_mask)
+    after_positive[:, :-1] = positive[:, 1:]
+    after_negative[:, :-1] = negative[:, 1:]
+    after_positive[last] = 0
+    after_negative[last] = boundary.negative_mask
+
+    return before_positive, before_negative, after_positive, after_negative
+
+
+def meets(positive, negative, masks):
+    '''Broadcast a test of (positive mask, negative mask) condition arrays,
+    with one entry per rule, against arrays of segment masks.'''
+    positive_condition = masks[0][:, None, None]
+    negative_condition = masks[1][:, None, None]
+
+    return ((positive[None] & positive_condition == positive_condition) &
+            (negative[None] & negative_condition == negative_condition))
+
+
+def rule_arrays(rules):
+    '''Stack the masks and anchors of the compiled rules into arrays. Missing
+    before and after conditions are empty masks, which always match.'''
+    def masks(conditions):
+        return (numpy.array([mask[0] for mask in conditions],
+                            dtype=numpy.int64),
+                numpy.array([mask[1] for mask in conditions],
+                            dtype=numpy.int64))
+
+    return (masks([rule.conditions for rule in rules]),
+            masks([rule.before or (0, 0) for rule in rules]),
+            masks([rule.after or (0, 0) for rule in rules]),
+            numpy.array([rule.first for rule in rules],
+                        dtype=bool)[:, None, None],
+            numpy.array([rule.last for rule in rules],
+                        dtype=bool)[:, None, None])
+
+
+def match(words, rules, encoded=None):
+    '''Return a boolean (rules × words × positions) array which is True where
+    the rule applies to the segment at that position, equivalent to calling
+    Word.index_applicable for every rule, word and index.'''
+    rules = [compile_rule(rule) for rule in rules]
+
+    if encoded is None:
+        encoded = encode(words)
+
+    positive, negative, lengths = encoded
+    height, width = positive.shape
+    result = numpy.zeros((len(rules), height, width), dtype=bool)
+
+    if not rules:
+        return result
+
+    conditions, before, after, first, last = rule_arrays(rules)
+    rows = max(block_size // max(len(rules) * width, 1), 1)
+
+    # Evaluate blocks of words, to bound the size of the broadcasted arrays
+    for start in range(0, height, rows):
+        block = slice(start, start + rows)
+        block_encoded = (positive[block], negative[block], lengths[block])
+        (before_positive, before_negative,
+         after_positive, after_negative) = contexts(block_encoded)
+
+        positions = numpy.arange(width)[None, :]
+        block_lengths = lengths[block][:, None]
+        valid = positions < block_lengths
+        is_first = numpy.broadcast_to(positions == 0, valid.shape)
+        is_last = positions == block_lengths - 1
+
+        result[:, block] = (
+            valid[None] &
+            meets(positive[block], negative[block], conditions) &
+            (~first | is_first[None]) &
+            (~last | is_last[None]) &
+            meets(before_positive, before_negative, before) &
+            meets(after_positive, after_negative, after))
+
+    return result
+
+
+def sites_from_matches(matches):
+    '''Convert a boolean (words × positions) array into a dictionary mapping
+    each word index onto its list of sites, as returned by
+    evolve.find_sites.'''
+    sites = {}
+
+    for row, column in zip(*numpy.nonzero(matches)):
+        sites.setdefault(int(row), []).append(int(column))
+
+    return sites
+
+
+def find_applicable_rules(words, rules, encoded=None):
+    '''The vectorised equivalent of evolve.find_applicable_rules. The words
+    may be given already encoded.'''
+    matches = match(words, rules, encoded)
+
+    return [(rule, sites_from_matches(matches[index]))
+            for index, rule in enumerate(rules) if matches[index].any()]
+
+
+def filter_rules(words, rules):
+    '''The vectorised equivalent of evolve.filter_rules.'''
+    matches = match(words, rules)
+
+    return [rule for index, rule in enumerate(rules)
+            if matches[index].any()]
+
+
+def apply_matches(encoded, rule, matches):
+    '''Apply the compiled rule to the encoded words at the positions where
+    the boolean (words × positions) array of matches is True, returning the
+    new encoded words. Deleted segments are removed by moving the segments
+    after them to the left.'''
+    positive, negative, lengths = encoded
+
+    if rule.deletion:
+        keep = (numpy.arange(positive.shape[1])[None, :] <
+                lengths[:, None]) & ~matches
+        rows, columns = numpy.nonzero(keep)
+        columns = (numpy.cumsum(keep, axis=1) - 1)[rows, columns]
+
+        new_positive = numpy.zeros_like(positive)
+        new_negative = numpy.zeros_like(negative)
+        new_positive[rows, columns] = positive[keep]
+        new_negative[rows, columns] = negative[keep]
+
+        return new_positive, new_negative, keep.sum(axis=1)
+
+    applies = rule.applies
+    positive = numpy.where(
+        matches,
+        (positive | applies.positive_mask) & ~applies.negative_mask,
+        positive)
+    negative = numpy.where(
+        matches,
+        (negative & ~applies.positive_mask) | applies.negative_mask,
+        negative)
+
+    return positive, negative, lengths
+
+
+def decode(encoded, row):
+    '''Return the Word encoded in the given row of the encoded words.'''
+    positive, negative, lengths = encoded
+    length = lengths[row]
+
+    return Word([MaskSegment(positive_mask, negative_mask)
+                 for positive_mask, negative_mask in
+                 zip(positive[row, :length].tolist(),
+                     negative[row, :length].tolist())])
+
+
+def apply_rule(words, rule, encoded=None):
+    '''Apply the rule to every word, returning a dictionary mapping the index
+    of each changed word onto the new Word, in the same form as
+    evolve.apply_at_sites.'''
+    rule = compile_rule(rule)
+
+    if encoded is None:
+        encoded = encode(words)
+
+    matches = match(words, [rule], encoded)[0]
+    encoded = apply_matches(encoded, rule, matches)
+
+    return {int(row): decode(encoded, row)
+            for row in numpy.nonzero(matches.any(axis=1))[0]}
+
+
+def apply_rules(words, rules):
+    '''Apply each rule in turn to every word, returning the list of new
+    Words. The words are encoded once and the masks are carried from rule to
+    rule, so Words are only built at the end, for the words which changed.'''
+    encoded = encode(words)
+    changed = numpy.zeros(len(words), dtype=bool)
+
+    for rule in rules:
+        rule = compile_rule(rule)
+        matches = match(words, [rule], encoded)[0]
+        changed |= matches.any(axis=1)
+        encoded = apply_matches(encoded, rule, matches)
+
+    new_words = list(words)
+
+    for row in numpy.nonzero(changed)[0]:
+        new_words[row] = decode(encoded, row)
+
+    return new_words
+
+
+def encode_strings(strings, alphabet):
+    '''Encode a list of feature strings as one array of position masks for
+    each character of the alphabet. Characters which aren't in the alphabet
+    have no bits set, so they differ from every character which is.'''
+    characters = numpy.array([list(string) for string in strings])
+    powers = numpy.uint64(1) << numpy.arange(characters.shape[1],
+                                             dtype=numpy.uint64)
+
+    return [((characters == character) * powers).sum(axis=1,
+                                                      dtype=numpy.uint64)
+            for character in alphabet]
+
+
+def nearest_feature_strings(feature_strings, index):
+    '''Return the IPA string which best matches each of the given feature
+    strings, using the rows of the FeatureIndex. This is the batch equivalent
+    of FeatureIndex.nearest: each string is encoded as position masks, and the
+    Hamming distances from every feature string to every distinct row are
+    counted as the bits set in a (strings × rows) array, in blocks. Ties are
+    broken by the shortest IPA string and then table order.'''
+    # The distinct rows are ranked by the tie rule, so the best match has the
+    # smallest (distance, rank).
+    entries = sorted(index.exact.items(), key=lambda item: item[1])
+    ranks = len(entries)
+
+    matches = [None] * len(feature_strings)
+    unmatched = []
+
+    for position, string in enumerate(feature_strings):
+        entry = index.exact.get(string)
+
+        if entry is None:
+            unmatched.append(position)
+        else:
+            matches[position] = entry[2]
+
+    if not unmatched:
+        return matches
+
+    table = encode_strings([string for string, entry in entries],
+                           index.alphabet)
+    targets = encode_strings([feature_strings[position]
+                              for position in unmatched], index.alphabet)
+    rows = max(block_size // ranks, 1)
+
+    for start in range(0, len(unmatched), rows):
+        block = slice(start, start + rows)
+        differences = numpy.zeros((len(unmatched[block]), ranks),
+                                  dtype=numpy.uint64)
+
+        for target, row in zip(targets, table):
+            differences |= target[block, None] ^ row[None]
+
+        distances = numpy.bitwise_count(differences).astype(numpy.int64)
+        best = (distances * ranks + numpy.arange(ranks)).argmin(axis=1)
+
+        for position, rank in zip(unmatched[block], best):
+            matches[position] = entries[rank][1][2]
+
+    return matches
@@ -1,4 +1,5 @@
-from segment import Segment, boundary
+from segment import boundary, add_masks
+from rule import CompiledRule, compile_rule
 
 
 class Word:
@@ -11,53 +12,66 @@ class Word:
 
     def __key(self):
         '''The key of a Word is a tuple containing a tuple for each segment,
-        where the first item is the set of segment.positive and the second is
-        the set of segment.negative. The function is necessary to use in both
-        equality testing and hashing; for this reason the hashable frozenset
-        is used.
+        where the first item is the positive feature mask of the segment and
+        the second is the negative feature mask. The function is necessary to
+        use in both equality testing and hashing; for this reason the hashable
+        integer masks are used.
 
         '''
-        return tuple((frozenset(segment.positive), frozenset(segment.negative))
+        return tuple((segment.positive_mask, segment.negative_mask)
                      for segment in self.segments)
 
     def __eq__(self, other):
         '''Compares Word objects by ensuring each segment is equal.'''
         return self.__key() == other.__key()
 
+    def __hash__(self):
+        return hash(self.__key())
+
     def index_applicable(self, index, rule):
         '''Given an index and a rule, check if the segment at the given index
-        meets the conditions of the current rule.'''
+        meets the conditions of the current rule. The rule may be a
+        CompiledRule or a rule dictionary.'''
+        if not isinstance(rule, CompiledRule):
+            rule = compile_rule(rule)
+
+        segments = self.segments
 
         # Break out if the current segment isn't applicable.
-        if not self.segments[index].meets_conditions(rule['conditions']):
+        segment = segments[index]
+        positive, negative = rule.conditions
+        if (segment.positive_mask & positive != positive or
+                segment.negative_mask & negative != negative):
             return False
 
         # Break out if the segment does not obey optional first, last, before,
         # or after indicators.
-        if 'first' in rule:
-            if index != 0:
-                return False
+        if rule.first and index != 0:
+            return False
 
-        if 'last' in rule:
-            if index != len(self.segments) - 1:
-                return False
+        if rule.last and index != len(segments) - 1:
+            return False
 
-        if 'before' in rule:
+        if rule.before is not None:
             if index == 0:
-                before_segment = boundary
+                segment = boundary
             else:
-                before_segment = self.segments[index - 1]
+                segment = segments[index - 1]
 
-            if not before_segment.meets_conditions(rule['before']):
+            positive, negative = rule.before
+            if (segment.positive_mask & positive != positive or
+                    segment.negative_mask & negative != negative):
                 return False
 
-        if 'after' in rule:
-            if index == len(self.segments) - 1:
-                after_segment = boundary
+        if rule.after is not None:
+            if index == len(segments) - 1:
+                segment = boundary
             else:
-                after_segment = self.segments[index + 1]
+                segment = segments[index + 1]
 
-            if not after_segment.meets_conditions(rule['after']):
+            positive, negative = rule.after
+            if (segment.positive_mask & positive != positive or
+                    segment.negative_mask & negative != negative):
                 return False
 
         # Finally, return True if nothing has caused an early exit
@@ -66,27 +80,53 @@ class Word:
     def applicable(self, rule):
         '''Returns True if any segment in the word meets all conditions of the
         given rule.'''
+        rule = compile_rule(rule)
 
         return any(self.index_applicable(i, rule) for i in
                    range(len(self.segments)))
 
+    def match_sites(self, rule):
+        '''Returns a list of the indices of every segment in the word which
+        meets all conditions of the given rule, in a single scan.'''
+        rule = compile_rule(rule)
+
+        return [i for i in range(len(self.segments))
+                if self.index_applicable(i, rule)]
+
     def apply_rule(self, rule):
         '''Apply the given rule to the current Segments, returning a new Word.'''
-        new_segments = []
+        rule = compile_rule(rule)
 
-        # Create a Segment from the rule to add to current segments
-        rule_segment = Segment(rule['applies'].get('positive', []),
-                               rule['applies'].get('negative', []))
+        return self.apply_at(self.match_sites(rule), rule)
 
-        for i in range(len(self.segments)):
-            if self.index_applicable(i, rule):
-                # If the rule contains the deletion feature, don't add the new
-                # segment, effectively removing it entirely. Otherwise, add the
-                # modified segment.
-                if 'deletion' not in rule['applies'].get('positive', []):
-                    new_segments.append(self.segments[i] + rule_segment)
+    def apply_at(self, sites, rule):
+        '''Apply the given rule to the segments at the given indices, which
+        must be those returned by match_sites for the same rule. The sites
+        aren't tested again. Returns a new Word.'''
+        rule = compile_rule(rule)
+        new_segments = list(self.segments)
 
-            else:
-                new_segments.append(self.segments[i])
+        # If the rule contains the deletion feature, remove the segments,
+        # working backwards so earlier sites keep their index. Otherwise,
+        # replace them with the modified segments.
+        if rule.deletion:
+            for i in reversed(sites):
+                del new_segments[i]
+
+        else:
+            for i in sites:
+                new_segments[i] = new_segments[i] + rule.applies
 
         return Word(new_segments)
+
+    def replaced_masks(self, sites, rule):
+        '''Return the feature masks of the segments which replace those at the
+        given sites when the rule is applied at them, as a list of tuples of
+        (positive mask, negative mask), for a rule which doesn't delete
+        segments. The new segments themselves aren't created.'''
+        rule = compile_rule(rule)
+        segments = self.segments
+
+        return [add_masks(segments[i].positive_mask, segments[i].negative_mask,
+                          rule.applies)
+                for i in sites]
@@ -0,0 +1,60 @@
+import os
+import sys
+import pickle
+import shutil
+import subprocess
+import os.path as path
+
+base_directory = path.dirname(path.dirname(path.abspath(__file__)))
+sys.path.append(path.join(base_directory, 'engine'))
+
+import bundle
+
+
+def test_bundle(tmpdir):
+    sources = {}
+
+    for name, filename in bundle.sources.items():
+        sources[name] = str(tmpdir.join(path.basename(filename)))
+        shutil.copy(filename, sources[name])
+
+    filename = str(tmpdir.join('bundle.pickle'))
+    compiled = bundle.load(filename, sources)
+    assert path.exists(filename)
+
+    loaded = bundle.load(filename, sources)
+    assert loaded.rules == compiled.rules
+    assert [rule.conditions for rule in loaded.compiled_rules] == \
+        [rule.conditions for rule in compiled.compiled_rules]
+
+    # Touching a source keeps the bundle, changing it rebuilds it
+    stamps = bundle.source_stamps(sources)
+    os.utime(sources['rules'], (0, 0))
+    assert bundle.is_current(stamps, sources)
+
+    with open(sources['rules'], 'r', encoding='utf-8') as f:
+        rules = f.read()
+
+    with open(sources['rules'], 'w', encoding='utf-8') as f:
+        f.write(rules.replace(loaded.rules[0]['name'], 'renamed', 1))
+
+    rebuilt = bundle.load(filename, sources)
+    assert rebuilt.rules != loaded.rules
+
+
+def test_bundle_script(tmpdir):
+    # The bundle written by running the module as a script is loaded as is
+    filename = str(tmpdir.join('bundle.pickle'))
+    subprocess.check_call([sys.executable,
+                           path.join(base_directory, 'engine', 'bundle.py'),
+                           filename])
+
+    with open(filename, 'rb') as f:
+        contents = pickle.load(f)
+
+    assert isinstance(contents['bundle'], bundle.Bundle)
+
+    modified = os.stat(filename).st_mtime_ns
+    loaded = bundle.load(filename)
+    assert isinstance(loaded, bundle.Bundle)
+    assert os.stat(filename).st_mtime_ns == modified
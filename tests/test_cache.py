@@ -0,0 +1,46 @@
+import sys
+import os.path as path
+
+base_directory = path.dirname(path.dirname(path.abspath(__file__)))
+sys.path.append(path.join(base_directory, 'engine'))
+
+from cache import LRUCache
+
+
+def test_lru_cache():
+    cache = LRUCache(2)
+
+    cache['a'] = 1
+    cache['b'] = 2
+    assert cache.get('a') == 1
+
+    # 'b' is now the least recently used item
+    cache['c'] = 3
+    assert 'b' not in cache
+    assert cache.get('b', 0) == 0
+    assert len(cache) == 2
+
+
+def test_lru_cache_counters():
+    cache = LRUCache()
+    cache['a'] = 1
+
+    cache.get('a')
+    cache.get('b')
+    cache.get('a')
+    assert (cache.hits, cache.misses) == (2, 1)
+
+
+def test_lru_cache_snapshot(tmpdir):
+    filename = str(tmpdir.join('cache.json'))
+    cache = LRUCache()
+    cache[('version', '+-0')] = 'ə'
+    cache['plain'] = 'a'
+    cache.save(filename)
+
+    loaded = LRUCache()
+    assert loaded.load(filename)
+    assert loaded.get(('version', '+-0')) == 'ə'
+    assert loaded.get('plain') == 'a'
+
+    assert not LRUCache().load(str(tmpdir.join('missing.json')))
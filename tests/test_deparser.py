@@ -1,12 +1,16 @@
 import sys
 import csv
+import yaml
+from collections import namedtuple
 import os.path as path
 
 base_directory = path.dirname(path.dirname(path.abspath(__file__)))
 
 sys.path.append(path.join(base_directory, 'engine'))
 
-from deparse import feature_string
+from deparse import (feature_string, segment_match, initialise_cache,
+                     FeatureIndex, DecompositionIndex)
+from parse import ParseContext
 from segment import Segment
 
 
@@ -15,3 +19,34 @@ def test_feature_string():
                       ['syllabic', 'stress', 'long', 'sonorant', 'continuant', 'delayedrelease', 'approximant', 'tap', 'trill', 'nasal', 'spreadglottis', 'constrictedglottis', 'round', 'labiodental', 'coronal', 'lateral', 'dorsal'])
 
     assert feature_string(segment) == '---+-------+--+---000--00000'
+
+
+def test_feature_index():
+    feature_strings = [['a', '+-0'], ['bb', '++0'], ['c', '+00'],
+                       ['d', '---'], ['e', '-+-']]
+    index = FeatureIndex(feature_strings)
+
+    for target in ['+-0', '+++', '0-0', '000', '+--', '0++', '-0-']:
+        initialise_cache()
+        segment = namedtuple('Target', ['feature_string'])(target)
+        assert index.nearest(target) == segment_match(feature_strings,
+                                                      segment)
+
+
+def test_decomposition_index():
+    with open(path.join(base_directory, 'engine', 'data', 'features.csv'),
+              'r', encoding='utf-8') as f:
+        segments = [segment for segment in csv.DictReader(f)]
+
+    with open(path.join(base_directory, 'engine', 'data', 'diacritics.yaml'),
+              'r', encoding='utf-8') as f:
+        diacritics = yaml.load(f)
+
+    index = DecompositionIndex(segments, diacritics)
+    context = ParseContext(segments, diacritics)
+
+    # Each segment is rebuilt exactly from a base and its diacritics
+    for token in ['b', 'b\u0325', 'a\u02d0', 'a\u0303\u02d0', 'k\u02b7']:
+        target = feature_string(context.token_to_segment(token))
+        deparsed = context.parse_word(index.nearest(target))
+        assert feature_string(deparsed.segments[0]) == target
@@ -1,4 +1,5 @@
 import yaml
+import pytest
 import sys
 import os.path as path
 
@@ -6,6 +7,10 @@ base_directory = path.dirname(path.dirname(path.abspath(__file__)))
 sys.path.append(path.join(base_directory, 'engine'))
 
 import engine
+import segment
+import parse
+from metrics import phonetic_product
+from evolve import Budget
 
 
 def rules_equal(first, second):
@@ -99,3 +104,106 @@ def test_rewrite():
 
     assert engine.rewrite([plain_word], rules, to='ipa')[0] == ipa_word
     assert engine.rewrite([ipa_word], rules, to='plain')[0] == plain_word
+
+    # Words are rewritten in one pass, so replacements aren't rewritten again
+    # by later rules, and the longest match is used whatever the rule order.
+    assert engine.rewrite(['yj', 'rrn'], rules, to='ipa') == ['jʒ', 'ɾn']
+    assert engine.rewrite(['rrn'], list(reversed(rules)), to='ipa') == ['ɾn']
+
+
+def test_engine_threads():
+    from concurrent.futures import ThreadPoolExecutor
+
+    words = ['bæd', 'kat', 'dɔg', 'haʊs', 'ʃip', 'fɪʃ']
+    expected = engine.run_engine(words, 4)
+
+    # A shared Engine gives the same results from several threads
+    shared = engine.Engine()
+
+    with ThreadPoolExecutor(4) as executor:
+        results = list(executor.map(lambda _: shared.run_engine(words, 4),
+                                    range(8)))
+
+    assert all(result == expected for result in results)
+    assert shared.deparse_cache.hits > 0
+
+
+def test_budget():
+    words = ['bæd', 'kat', 'dɔg', 'haʊs', 'ʃip', 'fɪʃ']
+    expected = engine.run_engine(words, 4)
+
+    budget = Budget(evaluations=10 ** 6)
+    assert engine.run_engine(words, 4, budget=budget) == expected
+    assert not budget.truncated
+
+    # The evolution stops between generations, keeping the rules applied so
+    # far, when the budget runs out.
+    budget = Budget(evaluations=budget.used // 2)
+    evolved, rules = engine.run_engine(words, 4, budget=budget)
+
+    assert budget.truncated
+    assert 0 < len(rules) < 4
+    assert rules == expected[1][:len(rules)]
+    assert (evolved, rules) == engine.run_engine(words, len(rules))
+
+    budget = Budget(deadline=0)
+    assert engine.run_engine(words, 4, budget=budget) == (words, [])
+    assert budget.truncated
+
+
+def test_iter_engine():
+    words = ['bæd', 'kat', 'dɔg', 'kat', 'haʊs', 'ʃip', 'fɪʃ', 'bæd']
+
+    for reverse in [False, True]:
+        expected_words, expected_rules = engine.run_engine(words, 4, [],
+                                                           reverse)
+
+        # Replaying the changed words of each generation gives the same words
+        # and rules as run_engine.
+        evolved = list(words)
+        rules = []
+
+        for generation, rule, changed, changed_words in engine.iter_engine(
+                words, 4, [], reverse):
+            assert generation == len(rules) + 1
+
+            for index, word in zip(changed, changed_words):
+                evolved[index] = word
+
+            rules.append(rule)
+
+        if reverse:
+            rules.reverse()
+
+        assert evolved == expected_words
+        assert rules == expected_rules
+
+
+def test_apply_rules_unknown_feature():
+    rule = {'name': 'Made up', 'description': 'A made up feature.',
+            'conditions': {'positive': ['syllabic']},
+            'applies': {'positive': ['madeup']}}
+    names = len(segment.feature_names)
+
+    # Features in the rules of a request aren't given new bits
+    with pytest.raises(ValueError):
+        engine.apply_rules(['bæd'], [rule])
+
+    assert len(segment.feature_names) == names
+
+
+def test_beam_selection():
+    words = ['bæd', 'haʊs']
+
+    def average(words):
+        parsed = parse.parse_words(words, engine.segments, engine.diacritics)
+
+        return sum(map(phonetic_product, parsed)) / len(parsed)
+
+    greedy, _ = engine.run_engine(words, 2)
+    beam, rules = engine.run_engine(words, 2, selection='beam')
+
+    # The beam finds a lexicon with a lower average metric than the greedy
+    # evolution, which only looks at the words each rule changes.
+    assert len(rules) == 2
+    assert average(beam) < average(greedy)
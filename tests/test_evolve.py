@@ -7,12 +7,30 @@ sys.path.append(path.join(base_directory, 'engine'))
 
 from word import Word
 from segment import Segment
-from evolve import filter_rules
+from evolve import (filter_rules, find_applicable_rules, average_metric_value,
+                    RuleTable, beam_search, Budget)
+from parallel import ParallelRuleTable
+import vectorised
 
 # Load rules
 with open(path.join(base_directory, 'engine', 'data', 'rules.yaml'), 'r') as f:
     rules = yaml.load(f)
 
+vowel = Segment(['syllabic', 'sonorant', 'voice', 'high', 'front'],
+                ['consonantal', 'nasal', 'back', 'low'])
+stop = Segment(['consonantal'],
+               ['syllabic', 'sonorant', 'continuant', 'delayedrelease',
+                'voice', 'dorsal'])
+nasal = Segment(['consonantal', 'sonorant', 'nasal', 'voice'],
+                ['syllabic', 'continuant'])
+
+words = [Word([stop, vowel, nasal]), Word([vowel, stop, stop, vowel]),
+         Word([nasal, vowel, stop])]
+
+
+def segment_count(word):
+    return len(word.segments)
+
 
 def test_filter_rules():
 
@@ -32,3 +50,122 @@ def test_filter_rules():
                   Segment(['high'], ['sonorant'])])
 
     assert filter_rules([word1, word2], [rule1, rule2]) == [rule2]
+
+
+def test_find_applicable_rules():
+    rule1 = {'applies': {'positive': ['nasal']},
+             'conditions': {'negative': ['nasal'],
+                            'positive': ['syllabic']},
+             'name': 'nasalization'}
+
+    rule2 = {'applies': {'positive': ['tonal']},
+             'conditions': {'positive': ['syllabic']},
+             'name': 'valid'}
+
+    word1 = Word([Segment(['consonantal'], ['tonal']),
+                  Segment(['sonorant'], ['high'])])
+
+    word2 = Word([Segment(['syllabic', 'low'], []),
+                  Segment(['high'], ['sonorant'])])
+
+    assert find_applicable_rules([word1, word2], [rule1, rule2]) == [
+        (rule2, {1: [0]})]
+
+
+def test_rule_table():
+    nasalization = {'applies': {'positive': ['nasal']},
+                    'conditions': {'negative': ['nasal'],
+                                   'positive': ['syllabic']},
+                    'name': 'nasalization'}
+
+    denasalization = {'applies': {'negative': ['nasal']},
+                      'conditions': {'positive': ['nasal', 'syllabic']},
+                      'name': 'denasalization'}
+
+    word1 = Word([Segment(['syllabic'], ['nasal'])])
+    word2 = Word([Segment(['consonantal'], ['syllabic'])])
+
+    table = RuleTable([word1, word2], [nasalization, denasalization],
+                      segment_count)
+
+    assert [rule.rule for rule in table.applicable_rules()] == [nasalization]
+
+    rule = table.best_rule(min)
+    assert rule.rule is nasalization
+
+    assert table.apply(rule) == [0]
+    assert table.words == [word1.apply_rule(nasalization), word2]
+
+    rule = table.best_rule(min)
+    assert rule.rule is denasalization
+    assert table.score(rule) == 1
+
+
+def test_lazy_best_rule():
+    exhaustive = RuleTable(words, rules, segment_count)
+    lazy = RuleTable(words, rules, segment_count)
+
+    for optimisation_function in [min, max, min, max]:
+        rule = exhaustive.best_rule(optimisation_function)
+        lazy_rule = lazy.lazy_best_rule(optimisation_function)
+
+        assert lazy_rule.rule is rule.rule
+
+        exhaustive.apply(rule)
+        lazy.apply(lazy_rule)
+
+
+def test_average_metric_value():
+    word1 = Word([Segment(['syllabic'], [])])
+    word2 = Word([Segment(['syllabic'], []), Segment(['nasal'], [])])
+
+    assert average_metric_value([word1, word2], segment_count) == 1.5
+    assert (average_metric_value([word1, word2], segment_count, [3, 1]) ==
+            1.25)
+
+
+def test_beam_search():
+    # Each rule is applied at most once
+    evolved, applied = beam_search(words, rules, 4, segment_count, max,
+                                   width=3, candidates=4)
+
+    assert len(applied) == 4
+    assert len(set(applied)) == 4
+
+
+def test_budget_populate():
+    # A lexicon large enough that filling the table dominates, which uses
+    # the vectorised backend if it is available
+    words = [Word([stop, vowel, stop]), Word([vowel, stop, stop, vowel])]
+    words = words * 3000
+
+    # The table stops filling as soon as the budget runs out
+    budget = Budget(deadline=0)
+    table = RuleTable(words, rules, segment_count, budget=budget)
+
+    assert budget.truncated
+    assert budget.used == 0
+    assert table.applicable_rules() == []
+
+    budget = Budget(evaluations=2)
+    table = RuleTable(words, rules, segment_count, budget=budget)
+
+    assert budget.truncated
+    assert len(table.applicable_rules()) == 2
+
+    # The parallel table records each chunk of rules as it is collected
+    budget = Budget(evaluations=2)
+    table = ParallelRuleTable(words, rules, segment_count, workers=2,
+                              budget=budget)
+
+    try:
+        assert budget.truncated
+        assert budget.used == vectorised.rule_group_size
+        assert len(table.applicable_rules()) <= budget.used
+    finally:
+        table.close()
+
+    evolved, applied = beam_search(words, rules, 3, segment_count, max,
+                                   budget=Budget(deadline=0))
+
+    assert applied == []
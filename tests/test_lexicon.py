@@ -0,0 +1,75 @@
+import sys
+import os.path as path
+
+base_directory = path.dirname(path.dirname(path.abspath(__file__)))
+sys.path.append(path.join(base_directory, 'engine'))
+
+from lexicon import collapse, expand, Lexicon
+from segment import MaskSegment
+from word import Word
+
+
+def test_collapse():
+    words = ['bæd', 'bɔɪ', 'bæd', 'kat', 'bæd', 'bɔɪ']
+
+    unique, counts, order = collapse(words)
+
+    assert unique == ['bæd', 'bɔɪ', 'kat']
+    assert counts == [3, 2, 1]
+    assert expand(unique, order) == words
+
+
+def test_lexicon():
+    vowel = MaskSegment.from_features(['syllabic'], ['nasal'])
+    nasal = MaskSegment.from_features(['nasal'], ['syllabic'])
+
+    words = [Word([nasal, vowel]), Word([vowel]), Word([vowel, nasal, vowel])]
+    lexicon = Lexicon(words)
+
+    assert len(lexicon) == 3
+    assert lexicon.segments == [nasal, vowel]
+    assert list(lexicon.codes) == [0, 1, 1, 1, 0, 1]
+    assert list(lexicon) == words
+
+    lexicon[1] = Word([nasal])
+    assert lexicon[1] == Word([nasal])
+    assert lexicon.compact() == [words[0], Word([nasal]), words[2]]
+
+    assert lexicon.join_segments(lambda segment: 'a' if segment is vowel
+                                 else 'n') == ['na', 'n', 'ana']
+
+
+def test_lexicon_copy():
+    vowel = MaskSegment.from_features(['syllabic'], ['nasal'])
+    nasal = MaskSegment.from_features(['nasal'], ['syllabic'])
+
+    lexicon = Lexicon([Word([vowel]), Word([vowel])])
+    copy = lexicon.copy()
+
+    # Appending to either Lexicon leaves the other unchanged
+    copy.append(Word([nasal]))
+    lexicon.append(Word([vowel, vowel]))
+
+    assert list(lexicon) == [Word([vowel]), Word([vowel]),
+                             Word([vowel, vowel])]
+    assert list(copy) == [Word([vowel]), Word([vowel]), Word([nasal])]
+    assert lexicon.segments == [vowel]
+
+
+def test_lexicon_merge():
+    vowel = MaskSegment.from_features(['syllabic'], ['nasal'])
+    nasal = MaskSegment.from_features(['nasal'], ['syllabic'])
+
+    words = [Word([vowel]), Word([nasal, vowel]), Word([vowel, vowel])] * 4
+    lexicon = Lexicon(words)
+    copy = lexicon.copy()
+
+    # Once the overlay passes its fraction, it is merged into the arrays
+    for index in [1, 4, 7, 10]:
+        lexicon[index] = Word([nasal])
+        words[index] = Word([nasal])
+
+    assert len(lexicon.overlay) < 4
+    assert list(lexicon) == words
+    assert list(copy) == [Word([vowel]), Word([nasal, vowel]),
+                          Word([vowel, vowel])] * 4
@@ -6,7 +6,10 @@ base_directory = path.dirname(path.dirname(path.abspath(__file__)))
 
 sys.path.append(path.join(base_directory, 'engine'))
 
-from metrics import phonetic_product, weighted_phonetic_product
+from metrics import (phonetic_product, weighted_phonetic_product,
+                     number_of_syllables, number_of_consonant_clusters,
+                     word_complexity_measure, metric_values, metric_state,
+                     changed_value, decomposable_metrics)
 from segment import Segment
 from word import Word
 
@@ -23,3 +26,41 @@ def test_phonetic_product():
                         Segment(['sonorant'], ['high'])])
     assert phonetic_product(word) == 2
     assert phonetic_product(featureless) == 1
+
+
+def test_metric_values():
+    vowel = Segment(['syllabic', 'front'], ['consonantal', 'back'])
+    stop = Segment(['consonantal', 'dorsal'], ['syllabic', 'delayedrelease'])
+    liquid = Segment(['consonantal', 'approximant', 'voice'], ['syllabic'])
+
+    words = [Word([stop, vowel, stop]),
+             Word([stop, liquid, vowel, vowel, stop, liquid]),
+             Word([vowel, stop, vowel, stop, vowel])]
+
+    assert [number_of_syllables(word) for word in words] == [1, 2, 3]
+    assert [number_of_consonant_clusters(word) for word in words] == [0, 2, 0]
+    assert [word_complexity_measure(word) for word in words] == [3, 7, 3]
+
+    for metric in [phonetic_product, weighted_phonetic_product,
+                   number_of_syllables, number_of_consonant_clusters,
+                   word_complexity_measure]:
+        assert metric_values(metric, words) == [metric(word)
+                                                for word in words]
+
+
+def test_changed_value():
+    vowel = Segment(['syllabic', 'front'], ['consonantal', 'back'])
+    stop = Segment(['consonantal', 'dorsal'], ['syllabic', 'delayedrelease'])
+    rule = {'name': 'devoicing', 'description': 'Devoicing',
+            'conditions': {'positive': ['consonantal']},
+            'applies': {'negative': ['voice'], 'positive': ['syllabic']}}
+
+    word = Word([stop, vowel, stop, stop, vowel])
+    sites = word.match_sites(rule)
+    changed = word.apply_rule(rule)
+
+    for metric in decomposable_metrics:
+        state = metric_state(metric, word)
+        masks = word.replaced_masks(sites, rule)
+
+        assert changed_value(metric, state, sites, masks) == metric(changed)
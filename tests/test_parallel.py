@@ -0,0 +1,80 @@
+import yaml
+import sys
+import os.path as path
+
+base_directory = path.dirname(path.dirname(path.abspath(__file__)))
+sys.path.append(path.join(base_directory, 'engine'))
+
+from evolve import RuleTable
+from parallel import ParallelRuleTable
+from metrics import phonetic_product
+from segment import MaskSegment, mask_features
+from word import Word
+
+# Load rules
+with open(path.join(base_directory, 'engine', 'data', 'rules.yaml'), 'r') as f:
+    rules = yaml.load(f)
+
+
+vowel = MaskSegment.from_features(
+    ['syllabic', 'sonorant', 'continuant', 'voice', 'high', 'front'],
+    ['consonantal', 'nasal', 'back', 'low', 'round'])
+stop = MaskSegment.from_features(
+    ['consonantal', 'labial'],
+    ['syllabic', 'sonorant', 'continuant', 'delayedrelease', 'voice',
+     'dorsal', 'nasal'])
+
+
+def marked_segments(word):
+    return sum('parallelmark' in mask_features(segment.positive_mask)
+               for segment in word.segments)
+
+
+def test_parallel_rule_table():
+    words = [Word([stop, vowel, stop]), Word([vowel, stop, stop, vowel]),
+             Word([stop, vowel])]
+
+    serial = RuleTable(words, rules, phonetic_product)
+    parallel = ParallelRuleTable(words, rules, phonetic_product, workers=2)
+
+    try:
+        for _ in range(3):
+            rule = serial.best_rule(max)
+            parallel_rule = parallel.best_rule(max)
+
+            assert parallel_rule.rule is rule.rule
+            assert serial.apply(rule) == parallel.apply(parallel_rule)
+            assert parallel.entries == {
+                parallel_rule: serial.entries[rule]
+                for parallel_rule, rule in zip(parallel.rules, serial.rules)}
+
+    finally:
+        parallel.close()
+
+
+def test_parallel_rule_table_without_rules():
+    parallel = ParallelRuleTable([Word([vowel])], [], phonetic_product,
+                                 workers=2)
+
+    try:
+        assert parallel.applicable_rules() == []
+    finally:
+        parallel.close()
+
+
+def test_parallel_rule_table_new_features():
+    # Features given bits by the engine have the same bits in the workers
+    marking = {'applies': {'positive': ['parallelmark']},
+               'conditions': {'positive': ['syllabic']},
+               'name': 'marking'}
+    words = [Word([stop, vowel]), Word([vowel, vowel])]
+
+    serial = RuleTable(words, [marking], marked_segments)
+    parallel = ParallelRuleTable(words, [marking], marked_segments,
+                                 workers=2)
+
+    try:
+        assert list(parallel.entries.values()) == \
+            list(serial.entries.values())
+    finally:
+        parallel.close()
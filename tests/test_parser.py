@@ -6,7 +6,8 @@ import os.path as path
 base_directory = path.dirname(path.dirname(path.abspath(__file__)))
 sys.path.append(path.join(base_directory, 'engine'))
 
-from parse import tokenise, valid_subword, token_to_segment, parse_words
+from parse import (tokenise, valid_subword, token_to_segment, parse_words,
+                   build_trie, ParseContext)
 from deparse import deparse_words
 from word import Word
 
@@ -29,6 +30,15 @@ def test_tokenise():
     assert tokenise('', available_segments, available_diacritics) == []
 
 
+def test_tokenise_trie():
+    trie = build_trie(available_segments)
+    diacritic_set = set(available_diacritics)
+
+    assert tokenise('bok͡piʰ', trie, diacritic_set) == ['b', 'o', 'k͡p', 'iʰ']
+    assert tokenise('bʰ\u0330a', trie, diacritic_set) == ['bʰ\u0330', 'a']
+    assert tokenise('ba' * 5000, trie, diacritic_set) == ['b', 'a'] * 5000
+
+
 def test_valid_subword():
     assert valid_subword('b', available_segments, available_diacritics)
     assert valid_subword('bʰ', available_segments, available_diacritics)
@@ -59,6 +69,18 @@ def test_token_to_segment():
     assert segment.negative == ['syllabic', 'stress', 'long', 'sonorant', 'continuant', 'delayedrelease', 'approximant', 'tap', 'trill', 'nasal', 'spreadglottis', 'constrictedglottis', 'round', 'labiodental', 'coronal', 'lateral', 'dorsal', 'voice']
 
 
+def test_parse_context():
+    context = ParseContext(segments, diacritics)
+
+    for token in ['b', 'bː', 'bː\u0303', 'b\u0325', 'k͡p']:
+        assert (context.token_to_segment(token).feature_string ==
+                token_to_segment(token, segments, diacritics).feature_string)
+
+    word = context.parse_word('bæd')
+    assert context.parse_word('bæd') is word
+    assert parse_words(['bæd'], segments, diacritics, context=context) == [word]
+
+
 def test_parse_words():
     word_strings = ['bæd', 'bɔɪ']
     words = parse_words(word_strings, segments, diacritics)
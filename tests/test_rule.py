@@ -0,0 +1,44 @@
+import sys
+import os.path as path
+
+base_directory = path.dirname(path.dirname(path.abspath(__file__)))
+sys.path.append(path.join(base_directory, 'engine'))
+
+from rule import CompiledRule, compile_rule
+from segment import feature_mask
+
+
+def test_compiled_rule():
+    rule = {'applies': {'positive': ['nasal']},
+            'before': {'positive': ['nasal']},
+            'conditions': {'negative': ['nasal'],
+                           'positive': ['syllabic']},
+            'last': True,
+            'name': 'nasalization',
+            'description': 'A description.'}
+
+    compiled = CompiledRule(rule)
+
+    assert compiled.rule is rule
+    assert compiled.conditions == (feature_mask(['syllabic']),
+                                   feature_mask(['nasal']))
+    assert compiled.before == (feature_mask(['nasal']), 0)
+    assert compiled.after is None
+    assert compiled.last and not compiled.first
+    assert not compiled.deletion
+    assert compiled.applies.positive == ['nasal']
+
+    assert compiled.reversed.applies.negative == ['nasal']
+    assert compiled.reversed is compiled.reversed
+
+
+def test_compile_rule():
+    rule = {'applies': {'positive': ['deletion']},
+            'conditions': {'positive': ['syllabic']},
+            'name': 'deletion'}
+
+    compiled = compile_rule(rule)
+
+    assert compiled.deletion
+    assert compile_rule(rule) is compiled
+    assert compile_rule(compiled) is compiled
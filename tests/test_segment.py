@@ -1,11 +1,12 @@
 import sys
+import pytest
 import os.path as path
 
 base_directory = path.dirname(path.dirname(path.abspath(__file__)))
 
 sys.path.append(path.join(base_directory, 'engine'))
 
-from segment import Segment
+from segment import Segment, MaskSegment
 
 
 def test_initialisation():
@@ -59,3 +60,38 @@ def test_meets_conditions():
                                      'negative': ['continuant']})
     assert not segment.meets_conditions({'positive': ['lateral'],
                                          'negative': ['continuant']})
+
+
+def test_mask_segment():
+    segment = MaskSegment.from_features(['voice', 'syllabic'],
+                                        ['consonantal', 'continuant'])
+
+    assert segment.positive == ['syllabic', 'voice']
+    assert segment.negative == ['consonantal', 'continuant']
+
+    assert segment.meets_conditions({})
+    assert segment.meets_conditions({'positive': ['syllabic', 'voice'],
+                                     'negative': ['continuant']})
+    assert not segment.meets_conditions({'positive': ['lateral'],
+                                         'negative': ['continuant']})
+
+
+def test_mask_segment_addition():
+    segment = MaskSegment.from_features(['stress'], ['syllabic'])
+
+    addition = segment + Segment(['syllabic'], ['voice', 'stress'])
+    assert addition.positive == ['syllabic']
+    assert addition.negative == ['stress', 'voice']
+
+
+def test_mask_segment_interning():
+    first = MaskSegment.from_features(['syllabic'], ['voice'])
+    second = MaskSegment.from_features(['syllabic'], ['voice'])
+
+    assert first is second
+    assert first == MaskSegment.from_segment(Segment(['syllabic'], ['voice']))
+    assert hash(first) == hash(second)
+    assert first.feature_string == Segment(['syllabic'], ['voice']).feature_string
+
+    with pytest.raises(AttributeError):
+        first.positive_mask = 0
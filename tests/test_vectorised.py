@@ -0,0 +1,82 @@
+import yaml
+import sys
+import pytest
+import os.path as path
+
+base_directory = path.dirname(path.dirname(path.abspath(__file__)))
+sys.path.append(path.join(base_directory, 'engine'))
+
+pytest.importorskip('numpy')
+
+import vectorised
+from evolve import find_applicable_rules, apply_at_sites
+from word import Word
+from segment import MaskSegment
+
+# Load rules
+with open(path.join(base_directory, 'engine', 'data', 'rules.yaml'), 'r') as f:
+    rules = yaml.load(f)
+
+vowel = MaskSegment.from_features(
+    ['syllabic', 'sonorant', 'continuant', 'voice', 'high', 'front'],
+    ['consonantal', 'nasal', 'back', 'low', 'round'])
+stop = MaskSegment.from_features(
+    ['consonantal'],
+    ['syllabic', 'sonorant', 'continuant', 'delayedrelease', 'voice',
+     'dorsal', 'nasal'])
+nasal = MaskSegment.from_features(
+    ['consonantal', 'sonorant', 'nasal', 'voice'],
+    ['syllabic', 'continuant'])
+
+words = [Word([stop, vowel, nasal]), Word([vowel, stop, stop, vowel]),
+         Word([nasal, vowel, stop]), Word([vowel]), Word([])]
+
+
+def test_find_applicable_rules():
+    assert (vectorised.find_applicable_rules(words, rules) ==
+            find_applicable_rules(words, rules))
+
+
+def test_no_rules():
+    assert vectorised.match(words, []).shape == (0, len(words), 4)
+    assert vectorised.find_applicable_rules(words, []) == []
+    assert vectorised.filter_rules(words, []) == []
+
+
+def test_apply_rule():
+    for rule, sites in find_applicable_rules(words, rules):
+        assert (vectorised.apply_rule(words, rule) ==
+                apply_at_sites(words, rule, sites))
+
+
+def test_apply_rules():
+    expected = list(words)
+
+    for rule in rules:
+        expected = [word.apply_rule(rule) for word in expected]
+
+    assert vectorised.apply_rules(words, rules) == expected
+
+
+def test_encode_lexicon():
+    from lexicon import Lexicon
+
+    lexicon = Lexicon(words)
+    lexicon[1] = Word([nasal])
+    lexicon[4] = Word([stop, vowel, stop, vowel, nasal])
+
+    for first, second in zip(vectorised.encode(lexicon),
+                             vectorised.encode(list(lexicon))):
+        assert (first == second).all()
+
+
+def test_nearest_feature_strings():
+    from deparse import FeatureIndex
+
+    feature_strings = [['a', '+-0'], ['bb', '++0'], ['c', '+00'],
+                       ['d', '---'], ['e', '-+-']]
+    index = FeatureIndex(feature_strings)
+    targets = ['+-0', '+++', '0-0', '000', '+--', '0++', '-0-']
+
+    assert (vectorised.nearest_feature_strings(targets, index) ==
+            [index.nearest(target) for target in targets])
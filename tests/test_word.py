@@ -88,6 +88,7 @@ def test_equality():
                   Segment(['syllabic'], ['nasal'])])
 
     assert word1 == word2
+    assert hash(word1) == hash(word2)
 
 
 def test_index_applicable():
@@ -119,3 +120,19 @@ def test_index_applicable_boundaries():
 
     assert not word.index_applicable(0, end_boundary)
     assert word.index_applicable(1, end_boundary)
+
+
+def test_match_sites():
+    rule = {'applies': {'positive': ['deletion']},
+            'conditions': {'positive': ['syllabic']},
+            'name': 'deletion'}
+
+    word = Word([Segment(['syllabic'], ['nasal']),
+                 Segment(['nasal'], ['syllabic']),
+                 Segment(['syllabic'], ['nasal'])])
+
+    sites = word.match_sites(rule)
+
+    assert sites == [0, 2]
+    assert word.apply_at(sites, rule) == Word([Segment(['nasal'],
+                                                       ['syllabic'])])